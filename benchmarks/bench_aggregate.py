@@ -0,0 +1,50 @@
+"""Compare the pure-Python and NumPy aggregation paths behind summary/graph.
+
+Usage: python benchmarks/bench_aggregate.py [ROWS]
+
+Builds a records.csv with ROWS rows (default 1,000,000) with
+generate_ledger.py in a temporary directory and times each grouping with NumPy disabled, with a cold
+column cache (first run after a change) and with a warm cache.
+"""
+import os, sys, tempfile, time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generate_ledger import generate
+import main
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        generate(tmp, rows, recurring=0)
+        # Build the cache whatever the ledger size, so "cold" is the build cost
+        main.COLUMN_CACHE_BYTES = 0
+        cases = [
+            ("summary", lambda: main.ledger_totals("type_category")),
+            ("summary --type expense --from 2021-01-01", lambda: main.ledger_totals("type_category", "expense", None, datetime(2021, 1, 1))),
+            ("graph --by category", lambda: main.ledger_totals("category", "expense")),
+            ("graph --by month", lambda: main.ledger_totals("month", "expense")),
+        ]
+        print(f"{rows:,} rows")
+        print(f"{'command':45} {'python':>9} {'numpy cold':>11} {'numpy warm':>11} {'speedup':>8}")
+        for name, fn in cases:
+            main.USE_NUMPY = False
+            t_py, expected = timed(fn)
+            main.USE_NUMPY = True
+            shutil_cache()
+            t_cold, cold = timed(fn)
+            t_warm, warm = timed(fn)
+            assert expected == cold == warm, name
+            print(f"{name:45} {t_py:8.3f}s {t_cold:10.3f}s {t_warm:10.3f}s {t_py / t_warm:7.1f}x")
+
+def shutil_cache():
+    import shutil
+    shutil.rmtree(main.COLUMN_CACHE_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,133 @@
+"""Time every TBudget command against synthetic ledgers of increasing size.
+
+Usage: python benchmarks/bench_commands.py [--sizes 10k,100k,1M] [--runs N] [--output FILE]
+       python benchmarks/bench_commands.py --compare OLD.json NEW.json
+
+For each size a ledger is generated with generate_ledger.py in a temporary
+directory, and each command runs as a fresh `python main.py ...` process
+(the daemon is bypassed). Wall time and peak RSS are recorded per run. The
+first run of each command is reported separately as "cold" since it may
+rebuild indexes. Results go to benchmarks/results/<commit>.json by default;
+--compare prints the warm-time ratio between two result files.
+"""
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import generate_ledger
+from generate_ledger import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+# (name, argv builder). Read-only commands first; the write commands change
+# the ledger, so they run last.
+def commands(rows):
+    middle = max(rows // 2, 1)
+    return [
+        ("summary", lambda run: ["summary"]),
+        ("summary --from/--to", lambda run: ["summary", "--from", "2022-01-01", "--to", "2022-06-30"]),
+        ("graph --by month", lambda run: ["graph", "--by", "month"]),
+        ("graph --by category", lambda run: ["graph", "--by", "category", "--type", "expense"]),
+        ("list --plain", lambda run: ["list", "--plain"]),
+        ("list --page 1", lambda run: ["list", "--page", "1", "--page-size", "50"]),
+        ("search", lambda run: ["search", "blue", "bottle"]),
+        ("show", lambda run: ["show", str(middle)]),
+        ("process_recurring", lambda run: ["show-recurring"]),
+        ("add-expense", lambda run: ["add-expense", "12.5", "food", "--note", "bench"]),
+        ("edit", lambda run: ["edit", str(middle + run), "note", "edited"]),
+        ("delete", lambda run: ["delete", str(middle + 100 + run)]),
+    ]
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+def set_last_applied(data_dir, day):
+    with open(os.path.join(data_dir, "recurring.json")) as f:
+        rules = json.load(f)
+    generate_ledger.set_last_applied(data_dir, rules, day.isoformat())
+
+# Runs one command, returning (wall seconds, peak RSS in KB) for that process
+def run_command(cwd, argv):
+    env = dict(os.environ, TBUDGET_NO_DAEMON="1")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, MAIN] + argv, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise RuntimeError(f"{' '.join(argv)} exited with {proc.returncode}")
+    rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return wall, rss
+
+def bench_size(rows, runs):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        data_dir = generate(tmp, rows)
+        print(f"\n{rows:,} rows (generated in {time.perf_counter() - t0:.1f}s)")
+        print(f"{'command':24} {'cold':>9} {'warm':>9} {'peak RSS':>10}")
+        today = date.today()
+        for name, argv in commands(rows):
+            walls, rss = [], 0
+            for run in range(runs + 1):
+                # Only the recurring benchmark should find rules due
+                due = name == "process_recurring"
+                set_last_applied(data_dir, today - timedelta(days=31) if due else today)
+                wall, peak = run_command(tmp, argv(run))
+                walls.append(wall)
+                rss = max(rss, peak)
+            warm = statistics.median(walls[1:])
+            print(f"{name:24} {walls[0]:8.3f}s {warm:8.3f}s {rss / 1024:8.1f}MB")
+            results.append({"rows": rows, "command": name, "argv": argv(0), "cold_s": walls[0],
+                            "warm_s": warm, "runs_s": walls[1:], "peak_rss_kb": rss})
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r["rows"], r["command"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print(f"{'rows':>10} {'command':24} {'old':>9} {'new':>9} {'ratio':>7}")
+    for r in new:
+        before = old.get((r["rows"], r["command"]))
+        if before:
+            ratio = r["warm_s"] / before["warm_s"] if before["warm_s"] else float("inf")
+            print(f"{r['rows']:>10,} {r['command']:24} {before['warm_s']:8.3f}s {r['warm_s']:8.3f}s {ratio:6.2f}x")
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark TBudget commands on synthetic ledgers")
+    p.add_argument("--sizes", default="10k,100k,1M", help="Comma-separated ledger sizes (e.g. 10k,100k,1M,10M)")
+    p.add_argument("--runs", type=int, default=3, help="Warm runs per command (after one cold run)")
+    p.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    p.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files")
+    args = p.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    commit = git_commit()
+    results = []
+    for size in args.sizes.split(","):
+        results.extend(bench_size(parse_size(size), args.runs))
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": commit, "date": datetime.now().isoformat(timespec="seconds"),
+                   "python": platform.python_version(), "platform": platform.platform(),
+                   "results": results}, f, indent=2)
+    print(f"\nWrote {output}")
+
+if __name__ == "__main__":
+    main()
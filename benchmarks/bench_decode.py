@@ -0,0 +1,159 @@
+"""Per-row cost of the shared row decoder against the per-reader parsing it replaced.
+
+Usage: python benchmarks/bench_decode.py [ROWS]
+
+Generates a records.csv with ROWS rows (default 200,000) with generate_ledger.py,
+reads it into memory and runs
+each read path over it twice, from CSV text to result: "before" reads rows with
+csv.DictReader and parses them the way each reader used to on its own (kept
+below for reference), "after" reads them the way the reader does now (raw
+csv.reader lists for totals, main.csv_rows dicts for everything else) and
+decodes them with main.decode_row. Both must give the same result. Times are
+nanoseconds per row, best of seven runs taken alternately.
+"""
+import csv, io, os, sys, tempfile, time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generate_ledger import generate
+import main
+
+def make_ledger(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = generate(tmp, count, recurring=0)
+        with open(os.path.join(data_dir, "records.csv"), newline="", encoding="utf-8") as f:
+            return f.read()
+
+def old_rows(text):
+    return csv.DictReader(io.StringIO(text, newline=""))
+
+def new_rows(text):
+    return main.csv_rows(io.StringIO(text, newline=""))
+
+# What CsvStore.iter_values yields
+def new_values(text):
+    rows = csv.reader(io.StringIO(text, newline=""))
+    next(rows)
+    return filter(None, rows)
+
+# The per-reader parsing before decode_row: every reader called fromisoformat
+# itself, built the month key with get_month and formatted with strftime.
+def old_totals(rows, by, filter_type=None, date_from=None, date_to=None):
+    totals = {}
+    for row in rows:
+        if filter_type and row["type"] != filter_type:
+            continue
+        if date_from or date_to or by == "month":
+            try:
+                dt = datetime.fromisoformat(row["datetime"])
+            except Exception:
+                continue
+            if date_from and dt < date_from:
+                continue
+            if date_to and dt > date_to:
+                continue
+        if by == "month":
+            key = main.get_month(dt)
+        elif by == "category":
+            key = row["category"]
+        else:
+            key = (row["type"], row["category"])
+        totals[key] = totals.get(key, 0) + main.to_minor(row["amount"])
+    return totals
+
+def old_list(rows, date_from=None, date_to=None):
+    cells = []
+    for row in rows:
+        if date_from or date_to:
+            try:
+                dt = datetime.fromisoformat(row["datetime"])
+            except Exception:
+                continue
+            if dt < date_from or dt > date_to:
+                continue
+        try:
+            main.to_minor(row["amount"])
+        except Exception:
+            continue
+        try:
+            dt_disp = datetime.fromisoformat(row["datetime"]).strftime("%Y-%m-%d %H:%M")
+        except Exception:
+            dt_disp = row["datetime"]
+        cells.append((dt_disp, main.amount_text(row["amount"])))
+    return cells
+
+# The order main.filter_records checks in: the date range before the amount
+def new_list(rows, date_from=None, date_to=None):
+    cells = []
+    for row in rows:
+        try:
+            dt = datetime.fromisoformat(row["datetime"])
+            if date_from and (dt < date_from or dt > date_to):
+                continue
+            rec = main.decode_row(row, dt)
+        except main.ROW_ERRORS:
+            continue
+        cells.append((main.display_time(rec), main.format_minor(rec.amount)))
+    return cells
+
+def old_aggregates(rows):
+    agg = main.empty_aggregates()
+    for row in rows:
+        try:
+            month = main.get_month(datetime.fromisoformat(row["datetime"]))
+            amount = main.to_minor(row["amount"])
+        except Exception:
+            continue
+        types = agg["months"].setdefault(month, {})
+        types[row["type"]] = types.get(row["type"], 0) + amount
+        cats = agg["categories"].setdefault(month, {}).setdefault(row["type"], {})
+        cats[row["category"]] = cats.get(row["category"], 0) + amount
+    return agg
+
+def new_aggregates(rows):
+    agg = main.empty_aggregates()
+    for row in rows:
+        main.update_aggregates(agg, row)
+    return agg
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+# Best per-row times of `before` and `after`, run alternately so that load on
+# the machine affects both alike
+def per_row(before, after, count, runs=7):
+    best = [float("inf"), float("inf")]
+    results = [None, None]
+    for _ in range(runs):
+        for i, fn in enumerate((before, after)):
+            elapsed, results[i] = timed(fn)
+            best[i] = min(best[i], elapsed)
+    return best[0] / count * 1e9, best[1] / count * 1e9, results
+
+def run(count):
+    text = make_ledger(count)
+    main._money_digits = 2
+    date_from, date_to = datetime(2020, 3, 1), datetime(2020, 6, 30)
+    cases = [
+        ("summary", lambda: old_totals(old_rows(text), "type_category"),
+         lambda: main.totals_from_rows(new_values(text), "type_category")),
+        ("summary --from/--to", lambda: old_totals(old_rows(text), "type_category", None, date_from, date_to),
+         lambda: main.totals_from_rows(new_values(text), "type_category", None, None, date_from, date_to)),
+        ("graph --by month", lambda: old_totals(old_rows(text), "month", "expense"),
+         lambda: main.totals_from_rows(new_values(text), "month", "expense")),
+        ("list (cells)", lambda: old_list(old_rows(text)), lambda: new_list(new_rows(text))),
+        ("list --from/--to (cells)", lambda: old_list(old_rows(text), date_from, date_to),
+         lambda: new_list(new_rows(text), date_from, date_to)),
+        ("aggregate index rebuild", lambda: old_aggregates(old_rows(text)), lambda: new_aggregates(new_rows(text))),
+    ]
+    print(f"{count:,} rows, ns per row")
+    print(f"{'reader':28} {'before':>8} {'after':>8} {'speedup':>8}")
+    for name, before, after in cases:
+        t_old, t_new, (expected, result) = per_row(before, after, count)
+        assert result == expected, name
+        print(f"{name:28} {t_old:8.0f} {t_new:8.0f} {t_old / t_new:7.2f}x")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
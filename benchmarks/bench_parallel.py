@@ -0,0 +1,36 @@
+"""Time the parallel CSV scan behind summary/graph with 1, 2, 4 and 8 workers.
+
+Usage: python benchmarks/bench_parallel.py [ROWS]
+
+Builds a records.csv with ROWS rows (default 2,000,000) with
+generate_ledger.py in a temporary directory, disables NumPy so the Python scan is measured, and checks
+that every worker count gives exactly the serial totals.
+"""
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generate_ledger import generate
+import main
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        generate(tmp, rows, recurring=0)
+        main.USE_NUMPY = False
+        main.load_id_index(main.get_store())
+        size = os.path.getsize(main.CSV_FILE) / 1e6
+        print(f"{rows:,} rows ({size:.0f} MB), {os.cpu_count()} CPUs")
+        print(f"{'command':25} " + " ".join(f"{f'{jobs} job' + 's' * (jobs > 1):>9}" for jobs in (1, 2, 4, 8)))
+        for name, by, filter_type in [("summary", "type_category", None), ("graph --by month", "month", "expense")]:
+            times, expected = [], None
+            for jobs in (1, 2, 4, 8):
+                main.SCAN_JOBS = jobs
+                t0 = time.perf_counter()
+                totals = main.ledger_totals(by, filter_type)
+                times.append(time.perf_counter() - t0)
+                expected = expected or totals
+                assert totals == expected, (name, jobs)
+            print(f"{name:25} " + " ".join(f"{t:8.2f}s" for t in times))
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000)
@@ -0,0 +1,55 @@
+"""Measure cold-start time of one-shot CLI commands.
+
+Usage: python benchmarks/bench_startup.py [RUNS]
+
+Runs each command RUNS times (default 5) as a fresh `python -X importtime
+main.py ...` process in a temporary data directory. Reports the median wall
+time, the time spent importing modules and the slowest top-level imports, so
+a new module-level import on the add-expense path shows up here.
+"""
+import os, statistics, subprocess, sys, tempfile, time
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+COMMANDS = [
+    ["add-expense", "12.5", "food", "--note", "lunch"],
+    ["add-income", "1000", "salary"],
+    ["summary"],
+    ["list", "--limit", "5"],
+    ["show-budgets"],
+    ["help"],
+]
+
+# Parses -X importtime output into {top-level module: cumulative microseconds}
+def import_times(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+def run(runs):
+    python = sys.executable
+    baseline = import_times(subprocess.run([python, "-X", "importtime", "-c", "pass"],
+                                           capture_output=True, text=True).stderr)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'command':40} {'wall':>8} {'imports':>8}  slowest imports")
+        for cmd in COMMANDS:
+            walls, imports = [], []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                proc = subprocess.run([python, "-X", "importtime", MAIN] + cmd,
+                                      cwd=tmp, capture_output=True, text=True)
+                walls.append(time.perf_counter() - t0)
+                times = {k: v for k, v in import_times(proc.stderr).items() if k not in baseline}
+                imports.append(times)
+            total = statistics.median(sum(t.values()) for t in imports)
+            slowest = sorted(imports[-1].items(), key=lambda kv: -kv[1])[:3]
+            top = ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in slowest)
+            print(f"{' '.join(cmd):40} {statistics.median(walls) * 1000:6.0f}ms {total / 1000:6.0f}ms  {top}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
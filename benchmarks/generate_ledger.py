@@ -0,0 +1,77 @@
+"""Generate a deterministic synthetic TBudget data directory.
+
+Usage: python benchmarks/generate_ledger.py DIR [--rows N] [--categories N]
+           [--start YYYY-MM-DD] [--days N] [--recurring N] [--no-budgets] [--seed N]
+
+Writes DIR/data/records.csv (with record IDs), budgets.json, recurring.json
+and the rules' last-applied markers (cache/recurring_state.json). The same
+arguments always produce byte-identical files, so benchmark runs on different
+commits see the same ledger.
+"""
+import argparse, csv, json, os, random, sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import recurring_key
+
+BASE_CATEGORIES = ["food", "rent", "water", "transport", "fun", "health", "salary", "gifts",
+                   "utilities", "insurance", "travel", "education", "clothes", "pets", "books"]
+MERCHANTS = ["Corner Shop", "Blue Bottle", "City Transit", "Green Grocer", "Main Street Pharmacy",
+             "Cinema Palace", "Book Nook", "Pet Planet", "Fuel Stop", "Noodle Bar"]
+
+def categories(count):
+    names = BASE_CATEGORIES[:count]
+    names += [f"category{i}" for i in range(len(names), count)]
+    return names
+
+# Writes the last-applied marker main.py keeps for each rule
+def set_last_applied(data_dir, rules, day):
+    os.makedirs(os.path.join(data_dir, "cache"), exist_ok=True)
+    with open(os.path.join(data_dir, "cache", "recurring_state.json"), "w") as f:
+        json.dump({recurring_key(rule): day for rule in rules}, f, indent=2)
+
+def generate(path, rows=100_000, n_categories=8, start=datetime(2020, 1, 1), days=5 * 365,
+             recurring=5, budgets=True, seed=42):
+    rng = random.Random(seed)
+    data_dir = os.path.join(path, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    cats = categories(n_categories)
+    step = days * 86400 / max(rows, 1)
+    with open(os.path.join(data_dir, "records.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "datetime", "type", "amount", "category", "note"])
+        for i in range(rows):
+            dt = start + timedelta(seconds=int(i * step))
+            rec_type = "income" if rng.random() < 0.1 else "expense"
+            note = f"{rng.choice(MERCHANTS)} #{rng.randrange(1000)}"
+            writer.writerow([i + 1, dt.isoformat(), rec_type, round(rng.uniform(1, 500), 2), rng.choice(cats), note])
+    with open(os.path.join(data_dir, "budgets.json"), "w") as f:
+        data = {"monthly": 5000.0, "categories": {cat: 500.0 for cat in cats[:3]}} if budgets else {}
+        json.dump(data, f, indent=2)
+    # Rules last applied a month before the ledger ends, so the first command
+    # run against the directory has recurring transactions to log
+    last = (start + timedelta(days=days) - timedelta(days=31)).date().isoformat()
+    rules = [{"type": "expense", "amount": 10.0 * (i + 1), "category": cats[i % len(cats)],
+              "note": f"Rule {i + 1}", "day": 1 + i * 7 % 28} for i in range(recurring)]
+    with open(os.path.join(data_dir, "recurring.json"), "w") as f:
+        json.dump(rules, f, indent=2)
+    set_last_applied(data_dir, rules, last)
+    return data_dir
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Generate a synthetic TBudget data directory")
+    p.add_argument("path", help="Directory to create data/ in")
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--categories", type=int, default=8)
+    p.add_argument("--start", default="2020-01-01", help="Date of the first record")
+    p.add_argument("--days", type=int, default=5 * 365, help="Days the records are spread over")
+    p.add_argument("--recurring", type=int, default=5, help="Number of recurring rules")
+    p.add_argument("--no-budgets", action="store_true")
+    p.add_argument("--seed", type=int, default=42)
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    data_dir = generate(args.path, args.rows, args.categories, datetime.fromisoformat(args.start),
+                        args.days, args.recurring, not args.no_budgets, args.seed)
+    print(f"Wrote {args.rows:,} records to {data_dir}")
@@ -1,16 +1,17 @@
-import csv, sys, os, json
+import csv, sys, os, io, re, json, calendar, shutil, dbm, glob, heapq, threading, contextlib, signal
 from argparse import ArgumentParser
-from datetime import datetime, date
-from rich.table import Table
+from datetime import datetime, date, time, timedelta
 from rich.console import Console
-from rich.panel import Panel
-from rich import box
-from rich.prompt import Prompt
-from rich.live import Live
-from rich.progress import BarColumn, Progress
-from rich.text import Text
 import shlex
-import requests
+from array import array
+from time import perf_counter
+from itertools import islice, chain
+from functools import lru_cache
+from collections import namedtuple
+try:
+    import fcntl
+except ImportError:  # Windows: writers aren't serialized
+    fcntl = None
 
 console = Console()
 
@@ -18,7 +19,45 @@ DATA_DIR = "data"
 CSV_FILE = os.path.join(DATA_DIR, "records.csv")
 BUDGET_FILE = os.path.join(DATA_DIR, "budgets.json")
 RECUR_FILE = os.path.join(DATA_DIR, "recurring.json")
+RECUR_STATE_FILE = os.path.join(DATA_DIR, "cache", "recurring_state.json")
+AGG_FILE = os.path.join(DATA_DIR, "aggregates.json")
+CONFIG_FILE = os.path.join(DATA_DIR, "config.json")
+JOURNAL_FILE = os.path.join(DATA_DIR, "journal.jsonl")
+ID_INDEX_FILE = os.path.join(DATA_DIR, "records.idx")
+ID_INDEX_META = os.path.join(DATA_DIR, "records.idx.json")
+SEARCH_INDEX = os.path.join(DATA_DIR, "search.db")
+SEARCH_LIMIT = 100
+IMPORT_BATCH = 50000
+PARALLEL_SCAN_BYTES = 64 * 1024 * 1024
+SCAN_JOBS = None  # --jobs; None picks automatically
+SERVE_SOCKET = os.path.join(DATA_DIR, "tbudget.sock")
+SERVE_TIMEOUT = 5  # seconds a daemon client gets to send its request
+LOCK_FILE = os.path.join(DATA_DIR, "tbudget.lock")
+PENDING_DIR = os.path.join(DATA_DIR, "pending")
+PENDING_CLAIM = os.path.join(PENDING_DIR, "commit.claim")
+# Commands a running `serve` daemon answers for the CLI
+SERVE_COMMANDS = ("add-expense", "ae", "add-income", "ai", "summary", "sum", "list", "ls",
+                  "graph", "gr", "search", "find", "f", "show", "get")
+RATES_FILE = os.path.join(DATA_DIR, "cache", "rates.json")
+RATES_URL = "https://open.er-api.com/v6/latest/{base}"
+RATES_TTL = 12 * 3600
+RATES_MAX_AGE = 7 * 24 * 3600
+DEFAULT_CURRENCY = "USD"
+AI_URL = "https://ai.hackclub.com/chat/completions"
+AI_CONTEXT_FILE = os.path.join(DATA_DIR, "cache", "ai_context.json")
+AI_CONTEXT_TOKENS = 2000
+AI_TOP_NOTES = 15
+AI_RECENT = 20
+COLUMNAR_DIR = os.path.join(DATA_DIR, "columnar")
+COLUMN_CACHE_DIR = os.path.join(DATA_DIR, "cache", "columns")
+# Building the column cache costs about two plain scans, so it is only
+# started for ledgers big enough for later warm runs to repay it
+COLUMN_CACHE_BYTES = 4 * 1024 * 1024
+PARTITION_DIR = os.path.join(DATA_DIR, "records")
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+UNDATED = "undated"
 FIELDS = ["datetime", "type", "amount", "category", "note"]
+RECORD_FIELDS = ["id"] + FIELDS
 PASSWORD_FILE = "password.txt"
 
 # Ensure the data directory exists
@@ -26,14 +65,6 @@ def ensure_data_dir():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-# Ensure the CSV file exists and has headers
-def ensure_csv():
-    ensure_data_dir()
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(FIELDS)
-
 def load_json(path, default):
     ensure_data_dir()
     if not os.path.exists(path):
@@ -44,205 +75,2140 @@ def load_json(path, default):
         except Exception:
             return default
 
-def save_json(path, data):
+# Writes go to a temporary file that is renamed over the target, so readers
+# and crashes never see a half-written file. sync=False skips the fsync for
+# derived files that can be rebuilt.
+def save_json(path, data, sync=True):
     ensure_data_dir()
-    with open(path, "w") as f:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
         json.dump(data, f, indent=2)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+_lock_depth = 0
+_lock_file = None
+
+# Exclusive advisory lock on data/tbudget.lock held by every writer, so
+# concurrent processes (cron jobs, shells, the daemon) take turns. Re-entrant
+# within a process; also usable as a decorator. A no-op where fcntl is missing.
+@contextlib.contextmanager
+def write_lock():
+    global _lock_depth, _lock_file
+    if _lock_depth == 0 and fcntl is not None:
+        ensure_data_dir()
+        _lock_file = open(LOCK_FILE, "a")
+        fcntl.flock(_lock_file, fcntl.LOCK_EX)
+    _lock_depth += 1
+    try:
+        yield
+    finally:
+        _lock_depth -= 1
+        if _lock_depth == 0 and _lock_file is not None:
+            fcntl.flock(_lock_file, fcntl.LOCK_UN)
+            _lock_file.close()
+            _lock_file = None
 
 def get_month(dt):
-    return dt.strftime("%Y-%m")
+    return f"{dt.year:04d}-{dt.month:02d}"
 
-def check_budgets(amount, category, dt, budgets):
-    alerts = []
-    month = get_month(dt)
-    monthly_total = 0
-    cat_total = 0
-    if os.path.exists(CSV_FILE):
-        with open(CSV_FILE) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
+# Money is kept as an integer count of the ledger currency's minor unit
+# (cents for USD) from parsing through aggregation, so totals are exact and
+# budget checks compare integers. Decimal strings are only produced for the
+# CSV files and on screen. JSON files (budgets, recurring rules) keep plain
+# major-unit numbers and are converted when read.
+CURRENCY_DIGITS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0, "PYG": 0,
+    "RWF": 0, "UGX": 0, "UYI": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+_money_digits = None
+
+def currency_digits(code):
+    return CURRENCY_DIGITS.get(code.upper(), 2)
+
+# Minor-unit digits of the ledger currency, read from the config once per command
+def money_digits():
+    global _money_digits
+    if _money_digits is None:
+        _money_digits = currency_digits(home_currency())
+    return _money_digits
+
+# Minor units for a major-unit amount given as a decimal string or a number.
+# Raises ValueError if it isn't one.
+def to_minor(value, digits=None):
+    if digits is None:
+        digits = money_digits() if _money_digits is None else _money_digits
+    if value.__class__ is str:
+        return parse_minor(value, digits)
+    if isinstance(value, int):
+        return value * 10 ** digits
+    return parse_minor(repr(value) if isinstance(value, float) else value, digits)
+
+# Plain decimals are split at the point without going through float; extra
+# digits round half away from zero. A ledger repeats the same amounts a lot,
+# so results are memoized.
+@lru_cache(maxsize=65536)
+def parse_minor(text, digits):
+    text = text.strip()
+    whole, _, frac = text.partition(".")
+    if frac.isdigit() or not frac:
+        try:
+            units = int(whole + frac[:digits].ljust(digits, "0")) if whole.strip("+-") or frac else None
+        except ValueError:
+            units = None
+        if units is not None:
+            if len(frac) > digits and frac[digits] >= "5":
+                units += -1 if whole.startswith("-") else 1
+            return units
+    from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {text!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"amount is not a number: {text!r}")
+    return int(amount.scaleb(digits).to_integral_value(ROUND_HALF_UP))
+
+# Converts minor units between scales, rounding half away from zero
+def rescale_minor(units, old_digits, new_digits):
+    if new_digits >= old_digits:
+        return units * 10 ** (new_digits - old_digits)
+    q, r = divmod(abs(units), 10 ** (old_digits - new_digits))
+    q += 2 * r >= 10 ** (old_digits - new_digits)
+    return -q if units < 0 else q
+
+# Decimal text for units stored at `stored` decimal places: with the ledger
+# currency's digits when that is exact, otherwise with all of them, so
+# nothing is lost when the text is parsed again
+def stored_amount_text(units, stored):
+    digits = money_digits()
+    if stored > digits and units % 10 ** (stored - digits):
+        return format_minor(units, stored)
+    return format_minor(rescale_minor(units, stored, digits), digits)
+
+def format_minor(units, digits=None):
+    if digits is None:
+        digits = money_digits()
+    if not digits:
+        return str(units)
+    whole, frac = divmod(abs(units), 10 ** digits)
+    return f"{'-' if units < 0 else ''}{whole}.{frac:0{digits}d}"
+
+# Major-unit number for the JSON files (exact: repr round-trips)
+def to_major(units, digits=None):
+    if digits is None:
+        digits = money_digits()
+    return units / 10 ** digits if digits else units
+
+# argparse type for amounts given on the command line
+def money(text):
+    return to_minor(text)
+
+def load_config():
+    return load_json(CONFIG_FILE, {})
+
+def save_config(config):
+    save_json(CONFIG_FILE, config)
+
+# Numeric ID of a ledger row, a dict or a RECORD_FIELDS list (0 if it
+# doesn't have a usable one)
+def record_id(row):
+    try:
+        return int(row[0] if row.__class__ is list else row["id"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0
+
+# Row dicts from CSV text whose first line is the header (or given
+# `fieldnames`). csv.reader values zipped with the header cost about a third
+# less per row than csv.DictReader; short rows are padded with None as
+# DictReader does.
+def csv_rows(f, fieldnames=None):
+    reader = csv.reader(f)
+    header = fieldnames or next(reader, None)
+    if not header:
+        return
+    width = len(header)
+    for values in reader:
+        if len(values) == width:
+            yield dict(zip(header, values))
+        elif values:
+            yield dict(zip(header, values + [None] * (width - len(values))))
+
+# A ledger row decoded for reading: the timestamp parsed once, its month key,
+# the amount in minor units, the text fields and the row it came from.
+# Readers decode rows through decode_row instead of parsing fields
+# themselves, so filters and formatters looking at the same row share one
+# parse. (Memoizing fromisoformat across rows doesn't pay: ledger timestamps
+# are nearly all distinct.)
+Record = namedtuple("Record", ["dt", "month", "type", "amount", "category", "note", "row"])
+
+# What decode_row raises for a row whose datetime or amount can't be read
+ROW_ERRORS = (AttributeError, KeyError, TypeError, ValueError)
+
+# Month key of an ISO timestamp. The ledger writes them as YYYY-MM-DDTHH:MM...,
+# so the key is sliced from the text; other forms fromisoformat accepts (such
+# as 20240105 or week dates) go through the parsed datetime.
+def month_key(text, dt):
+    return text[:7] if text[7:8] == "-" and text[5:6] != "W" else get_month(dt)
+
+# Decodes a row dict, or a raw [id, datetime, type, amount, category, note]
+# list as CsvStore.iter_values yields them (which skips building a dict).
+# `dt` is the row's timestamp when the caller has already parsed it.
+def decode_row(row, dt=None):
+    if row.__class__ is list:
+        _, text, rec_type, amount, category, note = row
+    else:
+        text, rec_type, amount, category, note = row["datetime"], row["type"], row["amount"], row["category"], row["note"]
+    if dt is None:
+        dt = datetime.fromisoformat(text)
+    return Record(dt, month_key(text, dt), rec_type, to_minor(amount), category, note, row)
+
+# A Record for a row decode_row rejected, so lists can still show it: the
+# datetime (and month) or amount that can't be read is None
+def partial_record(row, dt=None):
+    if row.__class__ is list:
+        _, text, rec_type, amount, category, note = row
+    else:
+        text, rec_type, amount, category, note = (row.get(f) for f in ("datetime", "type", "amount", "category", "note"))
+    if dt is None:
+        with contextlib.suppress(*ROW_ERRORS):
+            dt = datetime.fromisoformat(text)
+    try:
+        amount = to_minor(amount)
+    except ROW_ERRORS:
+        amount = None
+    return Record(dt, month_key(text, dt) if dt else None, rec_type, amount, category, note, row)
+
+# "YYYY-MM-DD HH:MM" for tables, sliced from the stored text when it is in the
+# ledger's own format (strftime costs more than the rest of the row). An
+# unreadable datetime is shown as stored.
+def display_time(rec):
+    text = rec.row[1] if rec.row.__class__ is list else rec.row["datetime"]
+    if rec.dt is None:
+        return str(text or "")
+    if text[4:5] == "-" and text[10:11] == "T" and text[13:14] == ":":
+        return f"{text[:10]} {text[11:16]}"
+    return rec.dt.strftime("%Y-%m-%d %H:%M")
+
+# The amount in the ledger currency; an unreadable one is shown as stored
+def display_amount(rec):
+    if rec.amount is None:
+        return str((rec.row[3] if rec.row.__class__ is list else rec.row["amount"]) or "")
+    return format_minor(rec.amount)
+
+# Rows readers skipped (or, with another `action`, showed as stored) because
+# their datetime or amount can't be read, as {(action, what the reader was
+# doing): [count, first few IDs]}. Reported on stderr when the command
+# finishes.
+_malformed = {}
+
+def note_malformed(reader, ids, count=None, action="Skipped"):
+    entry = _malformed.setdefault((action, reader), [0, []])
+    count = len(ids) if count is None else count
+    entry[0] += count
+    entry[1].extend(ids[:max(0, 5 - len(entry[1]))])
+    if PROFILE:
+        PROFILE.count("rows_malformed", count)
+
+def report_malformed():
+    for (action, reader), (count, ids) in sorted(_malformed.items()):
+        shown = ", ".join(f"#{i}" for i in ids if i)
+        if shown and count > len(ids):
+            shown += ", ..."
+        Console(stderr=True).print(f"[yellow]{action} {count} row{'s' * (count != 1)} with an unreadable date or amount while {reader}"
+                                   + (f": {shown} (see show/edit)" if shown else "") + "[/]", soft_wrap=True)
+    _malformed.clear()
+
+# Plain CSV ledger (data/records.csv); the default backend
+class CsvStore:
+    name = "csv"
+
+    def __init__(self, path=CSV_FILE):
+        self.path = path
+
+    def ensure(self):
+        ensure_data_dir()
+        if not os.path.exists(self.path):
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(RECORD_FIELDS)
+
+    # Ledgers written before records had IDs get them assigned in file order.
+    # The header is checked again under the lock in case another process
+    # upgraded the file while this one waited.
+    def upgrade(self):
+        if not self.needs_ids():
+            return
+        with write_lock():
+            if self.needs_ids():
+                rows = [dict(row, id=i) for i, row in enumerate(self.iter_rows(), 1)]
+                self.rewrite(rows)
+
+    def needs_ids(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        return bool(header) and "id" not in header
+
+    def files(self):
+        return [self.path]
+
+    # Size and mtime of the ledger, used to tell whether derived indexes are stale
+    def signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def iter_rows(self):
+        if not os.path.exists(self.path):
+            return
+        if PROFILE:
+            PROFILE.count("bytes_read", os.path.getsize(self.path))
+        with open(self.path, newline="", encoding="utf-8") as f:
+            yield from csv_rows(f)
+
+    # Rows as raw RECORD_FIELDS lists, for readers that decode them straight
+    # away (see decode_row)
+    def iter_values(self):
+        if not os.path.exists(self.path):
+            return
+        if PROFILE:
+            PROFILE.count("bytes_read", os.path.getsize(self.path))
+        with open(self.path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header == RECORD_FIELDS:
+                yield from filter(None, reader)
+            elif header:
+                for row in csv_rows(f, header):
+                    yield [row.get(field) for field in RECORD_FIELDS]
+
+    # rows are [id, datetime, type, amount, category, note] lists. Returns
+    # (byte offset of each row, number of rows skipped), like ColumnarStore.
+    def append(self, rows):
+        self.ensure()
+        lines = []
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow(row)
+            lines.append(buf.getvalue().encode("utf-8"))
+            buf.seek(0)
+            buf.truncate()
+        with open(self.path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        offsets = []
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line)
+        return offsets, 0
+
+    # Replace the whole ledger atomically: write a temp file, fsync, rename
+    def rewrite(self, rows):
+        ensure_data_dir()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    # Physical CSV records as (byte offset, raw bytes); a quoted field may
+    # span several lines, so lines are joined until the quotes balance
+    def scan_lines(self, f):
+        offset = f.tell()
+        pending, start = b"", offset
+        for line in f:
+            if not pending:
+                start = offset
+            pending += line
+            offset += len(line)
+            if pending.count(b'"') % 2 == 0:
+                yield start, pending
+                pending = b""
+
+    def parse_line(self, raw):
+        values = next(csv.reader([raw.decode("utf-8")]), [])
+        return dict(zip(RECORD_FIELDS, values))
+
+    # (id, byte offset) for every row, used to rebuild the ID index
+    def locations(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            lines = self.scan_lines(f)
+            next(lines, None)
+            for offset, raw in lines:
+                head = raw.split(b",", 1)[0]
+                if head.isdigit():
+                    yield int(head), offset
+
+    def read_at(self, offsets):
+        found = {}
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                for _, raw in self.scan_lines(f):
+                    found[offset] = self.parse_line(raw)
+                    break
+        return found
+
+    def rows_by_id(self, ids):
+        return indexed_rows(self, ids)
+
+    # Amounts are decimal text, so a new ledger currency needs no rewrite
+    def rescale(self, old_digits, new_digits):
+        pass
+
+    # Columnar copy of the CSV for the NumPy engine (data/cache/columns/).
+    # Appends are folded in from the last cached byte offset; any other change
+    # rebuilds it. Returns None if the ledger has rows the cache can't hold,
+    # or if there is no cache yet and the ledger is under COLUMN_CACHE_BYTES.
+    def column_cache(self, locked=False):
+        sig = self.signature()
+        if sig is None:
+            return None
+        cache = ColumnarStore(COLUMN_CACHE_DIR)
+        meta_file = os.path.join(COLUMN_CACHE_DIR, "meta.json")
+        meta = load_json(meta_file, None) if os.path.exists(cache.dict_file) else None
+        if meta is None and sig[0] < COLUMN_CACHE_BYTES:
+            return None
+        if meta and (meta.get("version") != 3 or meta.get("digits") != money_digits()):
+            meta = None
+        if meta and meta["signature"] == sig:
+            return cache if not meta["skipped"] else None
+        if not locked:
+            # Updating the cache mustn't overlap a write; check again under the lock
+            with write_lock():
+                return self.column_cache(locked=True)
+        if meta and sig[0] > meta["signature"][0] and self.read_bytes(meta["signature"][0] - len(meta["tail"]) // 2, meta["signature"][0]).hex() == meta["tail"]:
+            new_rows = filter(None, csv.reader(io.StringIO(self.read_bytes(meta["signature"][0], sig[0]).decode("utf-8"), newline="")))
+            skipped = meta["skipped"] + cache.append(new_rows)[1]
+        else:
+            skipped = cache.rewrite(self.iter_rows())
+        save_json(meta_file, {"version": 3, "digits": money_digits(), "signature": sig, "tail": self.read_bytes(max(0, sig[0] - 64), sig[0]).hex(), "skipped": skipped}, sync=False)
+        return cache if not skipped else None
+
+    def read_bytes(self, start, end):
+        if PROFILE:
+            PROFILE.count("bytes_read", end - start)
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    # An explicit --jobs asks for a Python-path scan, so it skips the NumPy cache
+    def totals(self, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+        if SCAN_JOBS is None and load_numpy() is not None:
+            cache = self.column_cache()
+            if cache is not None:
+                return cache.totals(by, filter_type, filter_category, date_from, date_to, exclude)
+        jobs = self.scan_jobs()
+        if jobs > 1:
+            return self.parallel_totals(jobs, by, filter_type, filter_category, date_from, date_to, exclude)
+        return totals_from_rows(self.iter_values(), by, filter_type, filter_category, date_from, date_to, exclude)
+
+    # Worker processes for a Python-path scan: SCAN_JOBS (--jobs) if set,
+    # otherwise one per core once the ledger passes PARALLEL_SCAN_BYTES. Only
+    # the active records.csv can be split, since it needs the ID index.
+    def scan_jobs(self):
+        if self.path != CSV_FILE or get_store().name != self.name or not os.path.exists(self.path):
+            return 1
+        if SCAN_JOBS is not None:
+            return max(1, SCAN_JOBS)
+        if os.path.getsize(self.path) < PARALLEL_SCAN_BYTES:
+            return 1
+        return min(os.cpu_count() or 1, 8)
+
+    # Splits the file into about `parts` byte ranges that each start at a row.
+    # A line that looks like a row start is only taken if the ID index puts
+    # that record at exactly this offset, so a newline inside a quoted note
+    # is never mistaken for one.
+    def split_ranges(self, parts):
+        load_id_index(self)
+        index = array("q")
+        with open(ID_INDEX_FILE, "rb") as f:
+            index.frombytes(f.read())
+        size = os.path.getsize(self.path)
+        starts = [0]
+        with open(self.path, "rb") as f:
+            first_row = len(f.readline())
+            for k in range(1, parts):
+                f.seek(max(size * k // parts, starts[-1], first_row))
+                f.readline()
+                offset = f.tell()
+                for line in iter(f.readline, b""):
+                    head = line.split(b",", 1)[0]
+                    if head.isdigit() and int(head) < len(index) and index[int(head)] == offset:
+                        break
+                    offset += len(line)
+                if starts[-1] < offset < size:
+                    starts.append(offset)
+        return list(zip(starts, starts[1:] + [size]))
+
+    def parallel_totals(self, jobs, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+        from concurrent.futures import ProcessPoolExecutor
+        totals = {}
+        ranges = self.split_ranges(jobs * 2)
+        if PROFILE:
+            PROFILE.count("bytes_read", sum(end - start for start, end in ranges))
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(scan_range, self.path, start, end, start == 0, by,
+                                   filter_type, filter_category, date_from, date_to, exclude)
+                       for start, end in ranges]
+            for future in futures:
+                partial, malformed = future.result()
+                for key, value in partial.items():
+                    totals[key] = totals.get(key, 0) + value
+                for (action, reader), (count, ids) in malformed.items():
+                    note_malformed(reader, ids, count, action)
+        return totals
+
+# Row-by-row group-by over dict rows; the reference implementation the
+# vectorized engine has to agree with. `exclude` holds record IDs to leave out.
+def totals_from_rows(rows, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+    totals = {}
+    for key, amount in grouped_amounts(rows, by, filter_type, filter_category, date_from, date_to, exclude):
+        totals[key] = totals.get(key, 0) + amount
+    return totals
+
+# (group key, amount) for every row (dict or RECORD_FIELDS list) that passes
+# the filters, in ledger order
+def grouped_amounts(rows, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+    for row in rows:
+        if exclude and record_id(row) in exclude:
+            continue
+        try:
+            rec = decode_row(row)
+        except ROW_ERRORS:
+            note_malformed("computing totals", [record_id(row)])
+            continue
+        if filter_type and rec.type != filter_type:
+            continue
+        if filter_category and rec.category != filter_category:
+            continue
+        if date_from and rec.dt < date_from:
+            continue
+        if date_to and rec.dt > date_to:
+            continue
+        if by == "month":
+            key = rec.month
+        elif by == "category":
+            key = rec.category
+        else:
+            key = (rec.type, rec.category)
+        yield key, rec.amount
+
+# Process-pool worker: parses one byte range of a CSV ledger (starting at a
+# row) and returns each group's total, plus the rows it had to skip (see
+# note_malformed). Amounts are integer minor units, so the partial totals add
+# up to exactly the serial result in any order.
+def scan_range(path, start, end, header, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+    _malformed.clear()
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    rows = csv.reader(io.StringIO(text, newline=""))
+    if header:
+        next(rows, None)
+    return totals_from_rows(filter(None, rows), by, filter_type, filter_category, date_from, date_to, exclude), dict(_malformed)
+
+EPOCH = datetime(1970, 1, 1)
+COLUMNS = {
+    "id": ("q", "id.i64"),
+    "datetime": ("q", "ts.i64"),
+    "type": ("i", "type.i32"),
+    "amount": ("q", "amount.i64"),
+    "category": ("i", "category.i32"),
+    "note": ("q", "note.off"),
+}
+AGG_COLUMNS = ("id", "datetime", "type", "amount", "category")
+
+def to_epoch_us(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+def from_epoch_us(us):
+    return EPOCH + timedelta(microseconds=us)
+
+# Encode rows (dicts or [id, datetime, type, amount, category, note] lists)
+# into column arrays, with amounts in minor units of `digits` decimal places
+# (the ledger currency's by default). Rows whose id, datetime or amount can't
+# be parsed are left out and counted.
+def encode_columns(rows, dicts, note_base=0, digits=None):
+    cols = {f: array(code) for f, (code, _) in COLUMNS.items()}
+    codes = {k: {v: i for i, v in enumerate(dicts[k])} for k in ("type", "category")}
+    blob = bytearray()
+    skipped = 0
+    for row in rows:
+        try:
+            rid, dt, rec_type, amount, category, note = [row[f] for f in RECORD_FIELDS] if isinstance(row, dict) else row
+            dt = dt if isinstance(dt, datetime) else datetime.fromisoformat(dt)
+            rid, ts, amount = int(rid), to_epoch_us(dt), to_minor(amount, digits)
+        except Exception:
+            skipped += 1
+            continue
+        for key, value in (("type", rec_type), ("category", category)):
+            if value not in codes[key]:
+                codes[key][value] = len(dicts[key])
+                dicts[key].append(value)
+        blob += (note or "").encode("utf-8")
+        cols["id"].append(rid)
+        cols["datetime"].append(ts)
+        cols["type"].append(codes["type"][rec_type])
+        cols["amount"].append(amount)
+        cols["category"].append(codes["category"][category])
+        cols["note"].append(note_base + len(blob))
+    return cols, bytes(blob), skipped
+
+# Columnar stores keep amounts at this fixed scale, enough for every currency
+# in CURRENCY_DIGITS, so changing the ledger currency never touches (or
+# rounds) stored amounts; readers convert to the currency's digits.
+COLUMNAR_DIGITS = 3
+
+# Binary columnar ledger (data/columnar/). IDs are int64, timestamps int64
+# epoch microseconds, amounts int64 units of 10**-digits (the store's scale,
+# recorded in dict.json), type/category int32 codes into dict.json and notes
+# a UTF-8 blob addressed by int64 end offsets. Every column is a flat
+# native-endian array, so it can be memory-mapped or loaded with array/NumPy,
+# and row slot i sits at i * itemsize in each file.
+class ColumnarStore:
+    name = "columnar"
+
+    def __init__(self, path=COLUMNAR_DIR):
+        self.path = path
+        self.dict_file = os.path.join(path, "dict.json")
+        self.blob_file = os.path.join(path, "note.bin")
+
+    def column_file(self, field):
+        return os.path.join(self.path, COLUMNS[field][1])
+
+    def ensure(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        for field in COLUMNS:
+            if not os.path.exists(self.column_file(field)):
+                open(self.column_file(field), "wb").close()
+        if not os.path.exists(self.blob_file):
+            open(self.blob_file, "wb").close()
+        if not os.path.exists(self.dict_file):
+            save_json(self.dict_file, {"type": [], "category": [], "digits": COLUMNAR_DIGITS})
+
+    # Stores written before records had IDs get them assigned in slot order,
+    # float64 amounts from before minor units are converted, and amounts kept
+    # at the ledger currency's scale move to COLUMNAR_DIGITS (exactly). Each
+    # step re-checks its condition under the lock, so two processes opening an
+    # old store at once upgrade it only once.
+    def upgrade(self):
+        if not os.path.exists(self.dict_file) or not self.needs_upgrade():
+            return
+        with write_lock():
+            self.upgrade_locked()
+
+    def needs_upgrade(self):
+        return (not os.path.exists(self.column_file("id"))
+                or (os.path.exists(os.path.join(self.path, "amount.f64")) and not os.path.exists(self.column_file("amount")))
+                or "digits" not in self.dictionaries())
+
+    def upgrade_locked(self):
+        if not os.path.exists(self.column_file("id")):
+            n = os.path.getsize(self.column_file("datetime")) // array("q").itemsize
+            with open(self.column_file("id"), "wb") as f:
+                array("q", range(1, n + 1)).tofile(f)
+        old = os.path.join(self.path, "amount.f64")
+        if os.path.exists(old) and not os.path.exists(self.column_file("amount")):
+            amounts = array("d")
+            with open(old, "rb") as f:
+                amounts.frombytes(f.read())
+            self.write_amounts(array("q", (to_minor(value, COLUMNAR_DIGITS) for value in amounts)))
+            os.remove(old)
+            dicts = self.dictionaries()
+            dicts["digits"] = COLUMNAR_DIGITS
+            save_json(self.dict_file, dicts)
+        dicts = self.dictionaries()
+        if "digits" not in dicts:
+            digits = money_digits()
+            self.write_amounts(array("q", (rescale_minor(value, digits, COLUMNAR_DIGITS) for value in self.read_column("amount"))))
+            dicts["digits"] = COLUMNAR_DIGITS
+            save_json(self.dict_file, dicts)
+
+    def write_amounts(self, amounts):
+        tmp = self.column_file("amount") + ".tmp"
+        with open(tmp, "wb") as f:
+            amounts.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.column_file("amount"))
+
+    # Amounts are kept at the store's own scale, so a new ledger currency
+    # needs no rewrite
+    def rescale(self, old_digits, new_digits):
+        pass
+
+    def files(self):
+        return [self.path]
+
+    def signature(self):
+        try:
+            st = os.stat(self.column_file("datetime"))
+            blob = os.stat(self.blob_file)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns, blob.st_size]
+
+    def dictionaries(self):
+        return load_json(self.dict_file, {"type": [], "category": []})
+
+    # Decimal places of the stored amounts. Column caches written before the
+    # scale was recorded hold the ledger currency's.
+    def digits(self, dicts=None):
+        return (dicts or self.dictionaries()).get("digits", money_digits())
+
+    # Rows in the store; a partially written tail (crash mid-append) is ignored
+    def __len__(self):
+        try:
+            return min(os.path.getsize(self.column_file(f)) // array(code).itemsize
+                       for f, (code, _) in COLUMNS.items())
+        except OSError:
+            return 0
+
+    def read_column(self, field):
+        code = COLUMNS[field][0]
+        col = array(code)
+        n = len(self)
+        with open(self.column_file(field), "rb") as f:
+            col.fromfile(f, n)
+        if PROFILE:
+            PROFILE.count("bytes_read", n * col.itemsize)
+        return col
+
+    # Returns (slots the rows were written to, number of rows skipped)
+    def append(self, rows):
+        self.ensure()
+        start = len(self)
+        dicts = self.dictionaries()
+        size = len(dicts["type"]), len(dicts["category"])
+        cols, blob, skipped = encode_columns(rows, dicts, os.path.getsize(self.blob_file), self.digits(dicts))
+        if (len(dicts["type"]), len(dicts["category"])) != size:
+            save_json(self.dict_file, dicts)
+        with open(self.blob_file, "ab") as f:
+            f.write(blob)
+            os.fsync(f.fileno())
+        for field, col in cols.items():
+            with open(self.column_file(field), "ab") as f:
+                col.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        return list(range(start, start + len(cols["id"]))), skipped
+
+    # Replace the whole ledger: build the new columns in a sibling directory,
+    # then swap it in with renames
+    def rewrite(self, rows):
+        tmp = ColumnarStore(self.path + ".tmp")
+        if os.path.exists(tmp.path):
+            shutil.rmtree(tmp.path)
+        tmp.ensure()
+        dicts = {"type": [], "category": [], "digits": COLUMNAR_DIGITS}
+        cols, blob, skipped = encode_columns(rows, dicts, digits=COLUMNAR_DIGITS)
+        save_json(tmp.dict_file, dicts)
+        with open(tmp.blob_file, "wb") as f:
+            f.write(blob)
+        for field, col in cols.items():
+            with open(tmp.column_file(field), "wb") as f:
+                col.tofile(f)
+        old = self.path + ".old"
+        if os.path.exists(self.path):
+            os.replace(self.path, old)
+        os.replace(tmp.path, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+        return skipped
+
+    # (id, slot) for every row, used to rebuild the ID index
+    def locations(self):
+        if os.path.exists(self.dict_file):
+            yield from ((rid, slot) for slot, rid in enumerate(self.read_column("id")))
+
+    # Rows are fixed-width slots, so each one is read with a seek per column
+    def read_at(self, slots):
+        n = len(self)
+        slots = [i for i in set(slots) if 0 <= i < n]
+        if not slots:
+            return {}
+        dicts = self.dictionaries()
+        digits = self.digits(dicts)
+        values = {}
+        for field, (code, _) in COLUMNS.items():
+            size = array(code).itemsize
+            with open(self.column_file(field), "rb") as f:
+                for i in slots:
+                    col = array(code)
+                    f.seek(i * size)
+                    col.fromfile(f, 1)
+                    if field == "note" and i > 0:
+                        f.seek((i - 1) * size)
+                        col.fromfile(f, 1)
+                    values[field, i] = col
+        found = {}
+        with open(self.blob_file, "rb") as f:
+            for i in slots:
+                ends = values["note", i]
+                start = ends[1] if len(ends) > 1 else 0
+                f.seek(start)
+                found[i] = {
+                    "id": str(values["id", i][0]),
+                    "datetime": from_epoch_us(values["datetime", i][0]).isoformat(),
+                    "type": dicts["type"][values["type", i][0]],
+                    "amount": stored_amount_text(values["amount", i][0], digits),
+                    "category": dicts["category"][values["category", i][0]],
+                    "note": f.read(ends[0] - start).decode("utf-8"),
+                }
+        return found
+
+    def rows_by_id(self, ids):
+        return indexed_rows(self, ids)
+
+    def iter_rows(self):
+        if not os.path.exists(self.dict_file):
+            return
+        dicts = self.dictionaries()
+        digits = self.digits(dicts)
+        cols = {f: self.read_column(f) for f in COLUMNS}
+        with open(self.blob_file, "rb") as f:
+            blob = f.read()
+        start = 0
+        for rid, ts, typ, amount, cat, end in zip(*(cols[f] for f in RECORD_FIELDS)):
+            yield {
+                "id": str(rid),
+                "datetime": from_epoch_us(ts).isoformat(),
+                "type": dicts["type"][typ],
+                "amount": stored_amount_text(amount, digits),
+                "category": dicts["category"][cat],
+                "note": blob[start:end].decode("utf-8"),
+            }
+            start = end
+
+    # Memory-mapped NumPy views of the columns used for aggregation
+    def load_columns(self, np):
+        n = len(self)
+        if n == 0:
+            return None
+        return {f: np.memmap(self.column_file(f), dtype=COLUMNS[f][0], mode="r", shape=(n,))
+                for f in AGG_COLUMNS}
+
+    # Group-by sums straight off the columns, through the NumPy engine when
+    # it is available and a loop over the raw arrays otherwise
+    def totals(self, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+        if not os.path.exists(self.dict_file):
+            return {}
+        dicts = self.dictionaries()
+        digits, target = self.digits(dicts), money_digits()
+        np = load_numpy()
+        if np is not None:
+            return aggregate_columns(np, self.load_columns(np), dicts, by, filter_type, filter_category, date_from, date_to, exclude, digits)
+        codes = filter_codes(dicts, filter_type, filter_category)
+        if codes is None:
+            return {}
+        type_code, category_code = codes
+        ts_from = to_epoch_us(date_from) if date_from else None
+        ts_to = to_epoch_us(date_to) if date_to else None
+        cols = [self.read_column(f) for f in AGG_COLUMNS]
+        totals = {}
+        for rid, ts, typ, amount, cat in zip(*cols):
+            if exclude and rid in exclude:
+                continue
+            if type_code is not None and typ != type_code:
+                continue
+            if category_code is not None and cat != category_code:
+                continue
+            if ts_from is not None and ts < ts_from:
+                continue
+            if ts_to is not None and ts > ts_to:
+                continue
+            if by == "month":
+                key = get_month(from_epoch_us(ts))
+            elif by == "category":
+                key = dicts["category"][cat]
+            else:
+                key = (dicts["type"][typ], dicts["category"][cat])
+            if digits != target:
+                amount = rescale_minor(amount, digits, target)
+            totals[key] = totals.get(key, 0) + amount
+        return totals
+
+USE_NUMPY = True
+
+# NumPy is optional; returns None when it is missing or disabled
+def load_numpy():
+    if not USE_NUMPY:
+        return None
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+# Dictionary codes for the type/category filters, or None if nothing can match
+def filter_codes(dicts, filter_type=None, filter_category=None):
+    type_code = category_code = None
+    if filter_type:
+        if filter_type not in dicts["type"]:
+            return None
+        type_code = dicts["type"].index(filter_type)
+    if filter_category:
+        if filter_category not in dicts["category"]:
+            return None
+        category_code = dicts["category"].index(filter_category)
+    return type_code, category_code
+
+# Vectorized group-by over columnar arrays. Filters become boolean masks and
+# the sums come from np.bincount. Its float64 sums of integer minor units are
+# exact below 2**53 (about 90 trillion dollars in cents), so they are turned
+# back into ints and match the Python loops exactly. Amounts stored with other
+# than the ledger currency's `digits` are rounded to it row by row first, as
+# the Python loops do.
+def aggregate_columns(np, cols, dicts, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None, digits=None):
+    codes = filter_codes(dicts, filter_type, filter_category)
+    if cols is None or codes is None:
+        return {}
+    type_code, category_code = codes
+    ts, types, amounts, cats = cols["datetime"], cols["type"], cols["amount"], cols["category"]
+    mask = np.ones(len(ts), dtype=bool)
+    if exclude:
+        mask &= ~np.isin(cols["id"], np.fromiter(exclude, dtype=np.int64))
+    if type_code is not None:
+        mask &= types == type_code
+    if category_code is not None:
+        mask &= cats == category_code
+    if date_from:
+        mask &= ts >= to_epoch_us(date_from)
+    if date_to:
+        mask &= ts <= to_epoch_us(date_to)
+    amounts = amounts[mask]
+    target = money_digits()
+    if digits is not None and digits > target:
+        unit = 10 ** (digits - target)
+        amounts = np.sign(amounts) * ((np.abs(amounts) + unit // 2) // unit)
+    elif digits is not None and digits < target:
+        amounts = amounts * 10 ** (target - digits)
+    if by == "month":
+        group = ts[mask].astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+    elif by == "category":
+        group = cats[mask].astype(np.int64)
+    else:
+        group = types[mask].astype(np.int64) * len(dicts["category"]) + cats[mask]
+    keys, inverse = np.unique(group, return_inverse=True)
+    sums = np.bincount(inverse, weights=amounts, minlength=len(keys)).round().astype(np.int64)
+    totals = {}
+    for k, v in zip(keys.tolist(), sums.tolist()):
+        if by == "month":
+            year, month = divmod(k, 12)
+            totals[f"{1970 + year:04d}-{month + 1:02d}"] = v
+        elif by == "category":
+            totals[dicts["category"][k]] = v
+        else:
+            typ, cat = divmod(k, len(dicts["category"]))
+            totals[(dicts["type"][typ], dicts["category"][cat])] = v
+    return totals
+
+# Month-partitioned CSV ledger (data/records/YYYY-MM.csv). manifest.json keeps
+# each partition's first/last timestamp, row count and per-type/category
+# totals, so date-bounded queries only open the partitions that overlap the
+# range and whole partitions are aggregated from the manifest alone. Rows
+# whose datetime can't be parsed go to "undated.csv".
+class PartitionedStore:
+    name = "partitioned"
+
+    def __init__(self, path=PARTITION_DIR):
+        self.path = path
+        self.manifest_file = os.path.join(path, "manifest.json")
+
+    def ensure(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    # Manifests from before minor units hold float totals
+    def upgrade(self):
+        manifest = self.manifest()
+        if any(isinstance(value, float) for info in manifest.values()
+               for cats in info["totals"].values() for value in cats.values()):
+            self.retotal()
+
+    # Recomputes the per-partition totals from the partition files
+    @write_lock()
+    def retotal(self):
+        manifest = self.manifest()
+        for month, info in manifest.items():
+            info["totals"] = {}
+            for row in self.partition(month).iter_rows():
+                self.add_total(info, row)
+        save_json(self.manifest_file, manifest)
+
+    def rescale(self, old_digits, new_digits):
+        self.retotal()
+
+    def files(self):
+        return [self.path]
+
+    def signature(self):
+        try:
+            st = os.stat(self.manifest_file)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def manifest(self):
+        return load_json(self.manifest_file, {})
+
+    def partition(self, month):
+        return CsvStore(os.path.join(self.path, month + ".csv"))
+
+    # Partition key for a row's datetime string
+    @staticmethod
+    def month_of(value):
+        try:
+            return month_key(value, datetime.fromisoformat(value))
+        except (TypeError, ValueError):
+            return UNDATED
+
+    # Partitions that can hold rows between date_from and date_to
+    def months(self, manifest, date_from=None, date_to=None):
+        months = []
+        for month, info in sorted(manifest.items()):
+            if month == UNDATED:
+                if not (date_from or date_to):
+                    months.append(month)
+                continue
+            if date_from and datetime.fromisoformat(info["max"]) < date_from:
+                continue
+            if date_to and datetime.fromisoformat(info["min"]) > date_to:
+                continue
+            months.append(month)
+        return months
+
+    def iter_rows(self, date_from=None, date_to=None):
+        manifest = self.manifest()
+        for month in self.months(manifest, date_from, date_to):
+            yield from self.partition(month).iter_rows()
+
+    @staticmethod
+    def track(manifest, month, row):
+        info = manifest.setdefault(month, {"min": None, "max": None, "rows": 0, "totals": {}})
+        if month != UNDATED:
+            # Normalized ISO strings sort chronologically
+            value = datetime.fromisoformat(row["datetime"]).isoformat()
+            info["min"] = min(info["min"] or value, value)
+            info["max"] = max(info["max"] or value, value)
+        info["rows"] += 1
+        PartitionedStore.add_total(info, row)
+
+    @staticmethod
+    def add_total(info, row):
+        try:
+            amount = to_minor(row["amount"])
+        except (AttributeError, ValueError):
+            return
+        cats = info["totals"].setdefault(row["type"], {})
+        cats[row["category"]] = cats.get(row["category"], 0) + amount
+
+    # Location of a row in the ID index: partition number in the high bits,
+    # byte offset within the partition file in the low 40
+    @staticmethod
+    def encode_location(month, offset):
+        index = 0 if month == UNDATED else int(month[:4]) * 12 + int(month[5:7]) - 1
+        return (index << 40) | offset
+
+    @staticmethod
+    def decode_location(loc):
+        index, offset = loc >> 40, loc & ((1 << 40) - 1)
+        return (UNDATED if index == 0 else f"{index // 12:04d}-{index % 12 + 1:02d}"), offset
+
+    def append(self, rows):
+        self.ensure()
+        manifest = self.manifest()
+        by_month = {}
+        for i, row in enumerate(rows):
+            by_month.setdefault(self.month_of(row[1]), []).append(i)
+        locations = [None] * len(rows)
+        for month, positions in by_month.items():
+            offsets, _ = self.partition(month).append([rows[i] for i in positions])
+            for i, offset in zip(positions, offsets):
+                locations[i] = self.encode_location(month, offset)
+                self.track(manifest, month, dict(zip(RECORD_FIELDS, map(str, rows[i]))))
+        save_json(self.manifest_file, manifest)
+        return locations, 0
+
+    # Replace the whole ledger: build the partitions in a sibling directory,
+    # then swap it in with renames
+    def rewrite(self, rows):
+        tmp = PartitionedStore(self.path + ".tmp")
+        if os.path.exists(tmp.path):
+            shutil.rmtree(tmp.path)
+        tmp.ensure()
+        manifest, writers, files = {}, {}, []
+        try:
+            for row in rows:
+                month = self.month_of(row["datetime"])
+                if month not in writers:
+                    f = open(tmp.partition(month).path, "w", newline="", encoding="utf-8")
+                    files.append(f)
+                    writers[month] = csv.DictWriter(f, fieldnames=RECORD_FIELDS, extrasaction="ignore")
+                    writers[month].writeheader()
+                writers[month].writerow(row)
+                self.track(manifest, month, row)
+        finally:
+            for f in files:
+                f.close()
+        save_json(tmp.manifest_file, manifest)
+        old = self.path + ".old"
+        if os.path.exists(self.path):
+            os.replace(self.path, old)
+        os.replace(tmp.path, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def locations(self):
+        for month in sorted(self.manifest()):
+            for rid, offset in self.partition(month).locations():
+                yield rid, self.encode_location(month, offset)
+
+    def read_at(self, locations):
+        by_month = {}
+        for loc in locations:
+            month, offset = self.decode_location(loc)
+            by_month.setdefault(month, []).append((loc, offset))
+        found = {}
+        for month, locs in by_month.items():
+            rows = self.partition(month).read_at([offset for _, offset in locs])
+            for loc, offset in locs:
+                if offset in rows:
+                    found[loc] = rows[offset]
+        return found
+
+    def rows_by_id(self, ids):
+        return indexed_rows(self, ids)
+
+    # Partitions entirely inside the date range are answered from the
+    # manifest; only the ones straddling a bound are scanned
+    def totals(self, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+        manifest = self.manifest()
+        totals = {}
+        def add(key, value):
+            totals[key] = totals.get(key, 0) + value
+        for month in self.months(manifest, date_from, date_to):
+            info = manifest[month]
+            if month == UNDATED and by == "month":
+                continue
+            inside = month != UNDATED and (not date_from or datetime.fromisoformat(info["min"]) >= date_from) and \
+                (not date_to or datetime.fromisoformat(info["max"]) <= date_to)
+            if not inside and (date_from or date_to):
+                for key, value in totals_from_rows(self.partition(month).iter_values(), by, filter_type,
+                                                   filter_category, date_from, date_to).items():
+                    add(key, value)
+                continue
+            fold_month_totals(add, month, info["totals"], by, filter_type, filter_category)
+        if exclude:
+            excluded = self.rows_by_id(exclude).values()
+            for key, value in totals_from_rows(excluded, by, filter_type, filter_category, date_from, date_to).items():
+                totals[key] -= value
+                if not totals[key]:
+                    del totals[key]
+        return totals
+
+STORES = {"csv": CsvStore, "columnar": ColumnarStore, "partitioned": PartitionedStore}
+
+_upgraded_stores = set()
+
+# The ledger backend selected by data/config.json ("backend": "csv" by default)
+def get_store(name=None):
+    name = name or load_config().get("backend", "csv")
+    if name not in STORES:
+        console.print(f"[yellow]Unknown backend '{name}', using csv.[/]")
+        name = "csv"
+    store = STORES[name]()
+    if name not in _upgraded_stores:
+        _upgraded_stores.add(name)
+        store.upgrade()
+    return store
+
+# ID index (data/records.idx): a flat int64 array where slot N holds the
+# location of record N in the active store (a byte offset into records.csv
+# or a row slot in the columnar store), or -1. Looking a record up is one
+# seek. records.idx.json remembers the store signature it was built against
+# and the next free ID; the index is rebuilt whenever they don't match.
+def load_id_index(store):
+    meta = load_json(ID_INDEX_META, None)
+    if (not isinstance(meta, dict) or meta.get("store") != store.name
+            or meta.get("signature") != store.signature() or not os.path.exists(ID_INDEX_FILE)):
+        with phase("index"):
+            meta = rebuild_id_index(store)
+    return meta
+
+@write_lock()
+def rebuild_id_index(store):
+    locations = array("q")
+    last_id = 0
+    for rid, loc in store.locations():
+        if rid <= 0:
+            continue
+        if rid >= len(locations):
+            locations.extend([-1] * (rid + 1 - len(locations)))
+        locations[rid] = loc
+        last_id = max(last_id, rid)
+    ensure_data_dir()
+    with open(ID_INDEX_FILE + ".tmp", "wb") as f:
+        locations.tofile(f)
+    os.replace(ID_INDEX_FILE + ".tmp", ID_INDEX_FILE)
+    # Never hand out an ID again, even if its record was compacted away
+    previous = load_json(ID_INDEX_META, {})
+    next_id = max(last_id + 1, previous.get("next_id", 1) if isinstance(previous, dict) else 1,
+                  max((s.footer["max_id"] + 1 for s in archive_segments()), default=1))
+    meta = {"store": store.name, "signature": store.signature(), "next_id": next_id}
+    save_json(ID_INDEX_META, meta, sync=False)
+    return meta
+
+# Record newly appended rows in the index
+def extend_id_index(store, meta, ids, locations):
+    itemsize = array("q").itemsize
+    with open(ID_INDEX_FILE, "r+b") as f:
+        end = f.seek(0, os.SEEK_END) // itemsize
+        if ids and ids[0] >= end and ids[-1] - ids[0] == len(ids) - 1:
+            # Usual case: fresh consecutive IDs, written in one go
+            array("q", [-1] * (ids[0] - end) + list(locations)).tofile(f)
+            end = ids[-1] + 1
+            ids, locations = [], []
+        for rid, loc in zip(ids, locations):
+            if rid > end:
+                f.seek(end * itemsize)
+                array("q", [-1] * (rid - end)).tofile(f)
+            f.seek(rid * itemsize)
+            array("q", [loc]).tofile(f)
+            end = max(end, rid + 1)
+    meta["signature"] = store.signature()
+    meta["next_id"] = max(meta["next_id"], end)
+    save_json(ID_INDEX_META, meta, sync=False)
+
+def lookup_id_index(ids):
+    itemsize = array("q").itemsize
+    found = {}
+    with open(ID_INDEX_FILE, "rb") as f:
+        size = f.seek(0, os.SEEK_END) // itemsize
+        for rid in ids:
+            if 0 < rid < size:
+                loc = array("q")
+                f.seek(rid * itemsize)
+                loc.fromfile(f, 1)
+                if loc[0] >= 0:
+                    found[rid] = loc[0]
+    return found
+
+# Base rows for the given record IDs, as {id: row}, found through the index
+def indexed_rows(store, ids):
+    load_id_index(store)
+    locations = lookup_id_index(ids)
+    rows = store.read_at(locations.values())
+    found = {}
+    for rid, loc in locations.items():
+        row = rows.get(loc)
+        # A mismatch means the index is stale; leave the row out
+        if row is not None and record_id(row) == rid:
+            found[rid] = row
+    return found
+
+
+# Parsed ledger kept in memory by long-running sessions (the shell). It is
+# reloaded when the store's signature (size/mtime) changes under it and is
+# updated in place by our own writes, so reads never go back to disk.
+class LedgerCache:
+    def __init__(self, store):
+        self.store = store
+        self.signature = None
+        self.digits = None
+        self.rows = []
+        self.positions = {}
+
+    # Amounts are encoded at the ledger currency's digits, so a currency
+    # change reloads the columns as well as a change to the store
+    def sync(self):
+        sig = self.store.signature()
+        if sig != self.signature or sig is None or self.digits != money_digits():
+            self.replace(list(self.store.iter_rows()))
+        return self
+
+    def replace(self, rows):
+        self.rows = rows
+        self.positions = {record_id(row): i for i, row in enumerate(rows)}
+        self.dicts = {"type": [], "category": []}
+        self.digits = money_digits()
+        self.cols, _, self.skipped = encode_columns(rows, self.dicts, digits=self.digits)
+        self.signature = self.store.signature()
+
+    # rows are the [id, datetime, type, amount, category, note] lists just written
+    def append(self, rows):
+        rows = [dict(zip(RECORD_FIELDS, map(str, row))) for row in rows]
+        for row in rows:
+            self.positions[record_id(row)] = len(self.rows)
+            self.rows.append(row)
+        cols, _, skipped = encode_columns(rows, self.dicts, digits=self.digits)
+        for field, col in cols.items():
+            self.cols[field].extend(col)
+        self.skipped += skipped
+        self.signature = self.store.signature()
+
+    def iter_rows(self):
+        return iter(self.rows)
+
+    def rows_by_id(self, ids):
+        return {i: self.rows[self.positions[i]] for i in ids if i in self.positions}
+
+    def totals(self, by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+        np = load_numpy()
+        if np is None or self.skipped:
+            return totals_from_rows(self.rows, by, filter_type, filter_category, date_from, date_to, exclude)
+        cols = {f: np.frombuffer(self.cols[f], dtype=COLUMNS[f][0]) for f in AGG_COLUMNS} if self.rows else None
+        return aggregate_columns(np, cols, self.dicts, by, filter_type, filter_category, date_from, date_to, exclude, self.digits)
+
+_ledger_cache = None
+
+def enable_ledger_cache():
+    global _ledger_cache
+    _ledger_cache = LedgerCache(get_store())
+
+# The in-memory ledger when one is enabled (and still for the active backend)
+def ledger_cache():
+    global _ledger_cache
+    if _ledger_cache is None:
+        return None
+    if _ledger_cache.store.name != load_config().get("backend", "csv"):
+        _ledger_cache = LedgerCache(get_store())
+    return _ledger_cache.sync()
+
+# Where base rows are read from: the in-memory ledger if enabled, else the store
+def ledger_source():
+    return ledger_cache() or get_store()
+
+# Edits and deletes are appended to data/journal.jsonl as field patches and
+# tombstones keyed by record ID, and applied when records are read. `compact`
+# folds them back into the base.
+def load_journal():
+    deleted, patches = set(), {}
+    if os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE) as f:
+            for line in f:
                 try:
-                    rdt = datetime.fromisoformat(row["datetime"])
-                    if get_month(rdt) == month and row["type"] == "expense":
-                        monthly_total += float(row["amount"])
-                        if row["category"] == category:
-                            cat_total += float(row["amount"])
-                except Exception:
+                    entry = json.loads(line)
+                except ValueError:
                     continue
+                if entry.get("op") == "delete":
+                    deleted.add(entry["id"])
+                    patches.pop(entry["id"], None)
+                elif entry.get("op") == "edit" and entry["id"] not in deleted:
+                    patches.setdefault(entry["id"], {})[entry["field"]] = entry["value"]
+    return deleted, patches
+
+@write_lock()
+def append_journal(entry):
+    ensure_data_dir()
+    with open(JOURNAL_FILE, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def journal_signature():
+    try:
+        return os.path.getsize(JOURNAL_FILE)
+    except OSError:
+        return 0
+
+# (record_id, row) pairs with the journal applied, archived months first
+# unless archived=False. A date range lets the partitioned store and the
+# archive skip months outside it (unless an edit moved a record's datetime,
+# which could bring it into range from anywhere).
+def iter_records(date_from=None, date_to=None, archived=True):
+    deleted, patches = load_journal()
+    source = ledger_source()
+    moved = any("datetime" in patch for patch in patches.values())
+    if isinstance(source, PartitionedStore) and (date_from or date_to) and not moved:
+        rows = source.iter_rows(date_from, date_to)
+    else:
+        rows = source.iter_rows()
+    if archived and archive_segments():
+        rows = chain(archived_rows(*((None, None) if moved else (date_from, date_to))), rows)
+    if PROFILE:
+        rows = PROFILE.iterate("load", rows, "rows_read")
+    for row in rows:
+        i = record_id(row)
+        if i in deleted:
+            continue
+        if i in patches:
+            row = dict(row, **patches[i])
+        yield i, row
+
+def ledger_rows():
+    return (row for _, row in iter_records())
+
+# Rows as stored (no journal applied), from the active store or the archive
+def base_rows_by_id(ids):
+    rows = ledger_source().rows_by_id(ids)
+    missing = [i for i in ids if i not in rows]
+    if missing:
+        rows.update(archived_rows_by_id(missing))
+    return rows
+
+# A single record by ID with the journal applied, or None if it doesn't exist
+def get_record(record_id):
+    return get_records([record_id]).get(record_id)
+
+def get_records(ids):
+    deleted, patches = load_journal()
+    rows = base_rows_by_id([i for i in ids if i not in deleted])
+    for i in rows:
+        if i in patches:
+            rows[i] = dict(rows[i], **patches[i])
+    return rows
+
+# Inverted search index (data/search.db, a dbm file). Note and category text
+# is split into lowercase word tokens, every token of 3 or more characters
+# contributes its trigrams, and each gram maps to the IDs of the records
+# containing it. Posting lists are stored in chunks of SEARCH_CHUNK IDs so
+# adding a record only rewrites the last chunk of each of its grams. The
+# index is append-only: deleted or edited-away matches are dropped when
+# candidates are checked against the records, and it is rebuilt after
+# compaction or outside changes.
+SEARCH_CHUNK = 512
+
+def text_grams(text):
+    grams = set()
+    for token in re.findall(r"\w+", (text or "").lower()):
+        grams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+def row_grams(row):
+    return text_grams(row["note"]) | text_grams(row["category"])
+
+# Grams every record containing `term` must have: the trigrams of its word
+# tokens. Terms shorter than 3 characters (or made of punctuation) give none,
+# since they can sit anywhere inside a word.
+def query_grams(term):
+    return text_grams(term)
+
+# The lowercase text search terms are matched against
+def search_text(row):
+    return f"{row['note'] or ''}\n{row['category'] or ''}".lower()
+
+def search_index_state():
+    store = get_store()
+    return {"store": store.name, "signature": store.signature(), "journal": journal_signature()}
+
+def add_postings(db, postings):
+    for gram, ids in postings.items():
+        key = gram.encode("utf-8")
+        chunks = int(db.get(b"n:" + key, b"0"))
+        last = array("q")
+        if chunks:
+            last.frombytes(db[b"p:%s:%d" % (key, chunks - 1)])
+        else:
+            chunks = 1
+        for rid in ids:
+            if len(last) >= SEARCH_CHUNK:
+                db[b"p:%s:%d" % (key, chunks - 1)] = last.tobytes()
+                last, chunks = array("q"), chunks + 1
+            last.append(rid)
+        db[b"p:%s:%d" % (key, chunks - 1)] = last.tobytes()
+        db[b"n:" + key] = str(chunks).encode()
+
+def postings(db, gram):
+    key = gram.encode("utf-8")
+    ids = array("q")
+    for chunk in range(int(db.get(b"n:" + key, b"0"))):
+        ids.frombytes(db[b"p:%s:%d" % (key, chunk)])
+    return set(ids)
+
+@write_lock()
+def rebuild_search_index():
+    index = {}
+    for rid, row in iter_records():
+        for gram in row_grams(row):
+            index.setdefault(gram, []).append(rid)
+    ensure_data_dir()
+    with dbm.open(SEARCH_INDEX, "n") as db:
+        add_postings(db, index)
+        db[b"__meta__"] = json.dumps(search_index_state()).encode()
+
+# Open the search index for a write that is about to happen, or None if it
+# doesn't exist or is already stale (it will be rebuilt on the next search)
+def open_search_index():
+    try:
+        db = dbm.open(SEARCH_INDEX, "w")
+    except Exception:
+        return None
+    if json.loads(db.get(b"__meta__", b"{}")) != search_index_state():
+        db.close()
+        return None
+    return db
+
+# Index the rows just written and mark the index current again
+def commit_search_index(db, rows=()):
+    if db is None:
+        return
+    index = {}
+    for row in rows:
+        for gram in row_grams(row):
+            index.setdefault(gram, []).append(record_id(row))
+    add_postings(db, index)
+    db[b"__meta__"] = json.dumps(search_index_state()).encode()
+    db.close()
+
+# Records matching a query. Whitespace-separated terms must all match
+# (AND); groups separated by OR are alternatives. A term matches when it is
+# a substring of the note or category. The index narrows each group down to
+# the records with all its trigrams; a group without any (only short or
+# punctuation terms) is matched by scanning the notes and categories.
+# Returns (ID, row) pairs in ID order, at most `limit` of them, and whether
+# more matches were left out.
+def search_index_query(query, limit=None):
+    groups = [[t.lower() for t in group.split()] for group in re.split(r"\s+OR\s+", query.strip())]
+    groups = [g for g in groups if g]
+    try:
+        db = dbm.open(SEARCH_INDEX, "r")
+        fresh = json.loads(db.get(b"__meta__", b"{}")) == search_index_state()
+    except Exception:
+        db, fresh = None, False
+    if not fresh:
+        if db is not None:
+            db.close()
+        with phase("index"):
+            rebuild_search_index()
+        db = dbm.open(SEARCH_INDEX, "r")
+    candidates = set()
+    scan = []
+    with db:
+        for group in groups:
+            grams = set().union(*(query_grams(term) for term in group))
+            if not grams:
+                scan.append(group)
+                continue
+            ids = None
+            for gram in sorted(grams, key=len, reverse=True):
+                ids = postings(db, gram) if ids is None else ids & postings(db, gram)
+                if not ids:
+                    break
+            candidates |= ids or set()
+    if scan:
+        for rid, row in iter_records():
+            text = search_text(row)
+            if any(all(term in text for term in group) for group in scan):
+                candidates.add(rid)
+    matches = []
+    ordered = sorted(candidates)
+    for start in range(0, len(ordered), SEARCH_CHUNK):
+        batch = ordered[start:start + SEARCH_CHUNK]
+        rows = get_records(batch)
+        for rid in batch:
+            row = rows.get(rid)
+            if row is None:
+                continue
+            text = search_text(row)
+            if any(all(term in text for term in group) for group in groups):
+                matches.append((rid, row))
+                if limit is not None and len(matches) > limit:
+                    return matches[:limit], True
+    return matches, False
+
+def empty_aggregates():
+    return {"signature": None, "digits": money_digits(), "months": {}, "categories": {}}
+
+# Add (sign=1) or remove (sign=-1) one row from the per-month aggregates
+def update_aggregates(agg, row, sign=1):
+    try:
+        rec = decode_row(row)
+    except ROW_ERRORS:
+        note_malformed("updating the aggregate index", [record_id(row)])
+        return
+    month, amount, typ, cat = rec.month, rec.amount * sign, rec.type, rec.category
+    types = agg["months"].setdefault(month, {})
+    types[typ] = types.get(typ, 0) + amount
+    cats = agg["categories"].setdefault(month, {}).setdefault(typ, {})
+    cats[cat] = cats.get(cat, 0) + amount
+    if sign < 0:
+        if not cats[cat]:
+            del cats[cat]
+        if not types[typ] and not cats:
+            del types[typ]
+            del agg["categories"][month][typ]
+
+# Archived months come from the segment footers; only records the journal
+# touches are read back from the archive
+@write_lock()
+def rebuild_aggregates():
+    agg = empty_aggregates()
+    segments = archive_segments()
+    for segment in segments:
+        if segment.footer["digits"] != money_digits():
+            for row in segment.iter_rows():
+                update_aggregates(agg, row)
+            continue
+        for month, types in segment.footer["totals"].items():
+            for typ, cats in types.items():
+                totals = agg["categories"].setdefault(month, {}).setdefault(typ, {})
+                for cat, value in cats.items():
+                    totals[cat] = totals.get(cat, 0) + value
+                agg["months"].setdefault(month, {})[typ] = agg["months"].get(month, {}).get(typ, 0) + sum(cats.values())
+    if segments:
+        deleted, patches = load_journal()
+        for rid, row in archived_rows_by_id(deleted | set(patches)).items():
+            update_aggregates(agg, row, -1)
+            if rid in patches:
+                update_aggregates(agg, dict(row, **patches[rid]))
+    for _, row in iter_records(archived=False):
+        update_aggregates(agg, row)
+    save_aggregates(agg)
+    return agg
+
+# Identifies the current ledger contents (store files plus journal) for
+# indexes derived from it
+def ledger_signature():
+    store = get_store()
+    signature = [store.name, journal_signature()] + (store.signature() or [])
+    archive = archive_signature()
+    return signature + [archive] if archive else signature
+
+def save_aggregates(agg):
+    agg["signature"] = ledger_signature()
+    save_json(AGG_FILE, agg, sync=False)
+
+# Load the aggregate index, rebuilding it if the ledger changed behind our back
+def load_aggregates():
+    agg = load_json(AGG_FILE, None)
+    if not isinstance(agg, dict) or agg.get("signature") != ledger_signature() or agg.get("digits") != money_digits():
+        with phase("index"):
+            return rebuild_aggregates()
+    return agg
+
+# With a projection (see load_projection) for the record's month, budgets that
+# aren't near their limit yet are also checked against the end-of-month
+# projection
+def check_budgets(amount, category, dt, budgets, agg=None, projection=None):
+    alerts = []
+    month = get_month(dt)
+    if agg is None:
+        agg = load_aggregates()
+    remaining = projection["remaining"] if projection and projection["month"] == month else None
+    monthly_total = agg["months"].get(month, {}).get("expense", 0)
+    cat_total = agg["categories"].get(month, {}).get("expense", {}).get(category, 0)
     if "monthly" in budgets:
-        limit = budgets["monthly"]
+        limit = to_minor(budgets["monthly"])
         if monthly_total + amount > limit:
-            alerts.append(f"[bold red]🚨 Monthly budget exceeded! ({monthly_total+amount:.2f}/{limit})[/]")
-        elif monthly_total + amount > 0.9 * limit:
-            alerts.append(f"[red]⚠️ Near monthly budget! ({monthly_total+amount:.2f}/{limit})[/]")
+            alerts.append(f"[bold red]🚨 Monthly budget exceeded! ({format_minor(monthly_total + amount)}/{format_minor(limit)})[/]")
+        elif 10 * (monthly_total + amount) > 9 * limit:
+            alerts.append(f"[red]⚠️ Near monthly budget! ({format_minor(monthly_total + amount)}/{format_minor(limit)})[/]")
+        elif remaining is not None and monthly_total + amount + sum(remaining.values()) > limit:
+            alerts.append(f"[yellow]📈 On track to exceed the monthly budget (projected {format_minor(monthly_total + amount + sum(remaining.values()))}/{format_minor(limit)})[/]")
     if "categories" in budgets and category in budgets["categories"]:
-        limit = budgets["categories"][category]
+        limit = to_minor(budgets["categories"][category])
         if cat_total + amount > limit:
-            alerts.append(f"[bold red]🚨 {category} budget exceeded! ({cat_total+amount:.2f}/{limit})[/]")
-        elif cat_total + amount > 0.9 * limit:
-            alerts.append(f"[red]⚠️ Near {category} budget! ({cat_total+amount:.2f}/{limit})[/]")
+            alerts.append(f"[bold red]🚨 {category} budget exceeded! ({format_minor(cat_total + amount)}/{format_minor(limit)})[/]")
+        elif 10 * (cat_total + amount) > 9 * limit:
+            alerts.append(f"[red]⚠️ Near {category} budget! ({format_minor(cat_total + amount)}/{format_minor(limit)})[/]")
+        elif remaining is not None and cat_total + amount + remaining.get(category, 0) > limit:
+            alerts.append(f"[yellow]📈 On track to exceed the {category} budget (projected {format_minor(cat_total + amount + remaining.get(category, 0))}/{format_minor(limit)})[/]")
     return alerts
 
-def add_record(rec_type: str, amount: float, category: str, note: str):
-    ensure_csv()
-    dt = datetime.now()
+# Append rows ([datetime, type, amount, category, note]) in one write and
+# return the budget alerts they trigger (skipped with alerts=False; one list
+# per row with per_row=True)
+@write_lock()
+def append_records(rows, alerts=True, per_row=False):
+    store = get_store()
     budgets = load_json(BUDGET_FILE, {})
+    agg = load_aggregates()
+    projection = load_projection(agg) if alerts and budgets else None
+    found = []
+    for dt, rec_type, amount, category, note in rows:
+        found.append(check_budgets(amount, category, dt, budgets, agg, projection) if alerts and rec_type == "expense" else [])
+        update_aggregates(agg, dict(zip(FIELDS, [dt.isoformat(), rec_type, format_minor(amount), category, note])))
+    cache = ledger_cache()
+    search_db = open_search_index()
+    index = load_id_index(store)
+    ids = list(range(index["next_id"], index["next_id"] + len(rows)))
+    written = [[rid, dt.isoformat(), rec_type, format_minor(amount), category, note] for rid, (dt, rec_type, amount, category, note) in zip(ids, rows)]
+    with phase("write"):
+        locations, _ = store.append(written)
+    if PROFILE:
+        PROFILE.count("rows_written", len(written))
+    extend_id_index(store, index, ids, locations)
+    if search_db is not None:
+        commit_search_index(search_db, [dict(zip(RECORD_FIELDS, map(str, row))) for row in written])
+    if cache:
+        cache.append(written)
+    save_aggregates(agg)
+    return found if per_row else [alert for row_alerts in found for alert in row_alerts]
+
+# Group commit for one-off writers like scripted add-expense calls. Each writer
+# leaves its rows in data/pending/ and waits for the write lock; whoever gets
+# it commits every pending batch with a single append and fsync, and leaves
+# the other writers their budget alerts in a .done file. Files are named
+# <timestamp>-<pid>. The flusher renames the batches it takes to .claimed and
+# notes the first ID they will get in commit.claim before appending, so a
+# flush that dies part way is finished or undone by the next one instead of
+# being appended twice.
+def group_append(rows):
+    if fcntl is None:
+        return append_records(rows)
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    name = os.path.join(PENDING_DIR, f"{datetime.now():%Y%m%d%H%M%S%f}-{os.getpid()}")
+    save_json(name + ".json", [[dt.isoformat(), rec_type, amount, category, note]
+                               for dt, rec_type, amount, category, note in rows], sync=False)
+    with write_lock():
+        recover_claimed()
+        if os.path.exists(name + ".done"):
+            alerts = load_json(name + ".done", [])
+            os.remove(name + ".done")
+            return alerts
+        remove_orphaned_markers()
+        batches = []
+        for path in sorted(glob.glob(os.path.join(PENDING_DIR, "*.json"))):
+            pending = load_json(path, [])
+            claimed = path[:-len(".json")] + ".claimed"
+            os.replace(path, claimed)
+            batches.append((claimed, [(datetime.fromisoformat(r[0]), r[1], int(r[2]), r[3], r[4]) for r in pending]))
+        save_json(PENDING_CLAIM, {"first_id": load_id_index(get_store())["next_id"]})
+        found = append_records([row for _, batch in batches for row in batch], per_row=True)
+        mine = []
+        for path, batch in batches:
+            alerts = [alert for row_alerts in found[:len(batch)] for alert in row_alerts]
+            found = found[len(batch):]
+            if path == name + ".claimed":
+                mine = alerts
+            else:
+                save_json(path[:-len(".claimed")] + ".done", alerts, sync=False)
+            os.remove(path)
+        os.remove(PENDING_CLAIM)
+        return mine
+
+# Batches a crashed flusher had claimed. If its append reached the ledger
+# (the next free ID moved past the one it noted) they are marked done, with
+# their budget alerts lost; otherwise they go back in the queue. Called under
+# the write lock.
+def recover_claimed():
+    claimed = sorted(glob.glob(os.path.join(PENDING_DIR, "*.claimed")))
+    claim = load_json(PENDING_CLAIM, None)
+    committed = bool(claimed) and claim is not None and load_id_index(get_store())["next_id"] > claim["first_id"]
+    for path in claimed:
+        base = path[:-len(".claimed")]
+        if committed:
+            save_json(base + ".done", [], sync=False)
+            os.remove(path)
+        else:
+            os.replace(path, base + ".json")
+    if os.path.exists(PENDING_CLAIM):
+        os.remove(PENDING_CLAIM)
+
+# .done markers left by writers that exited before collecting them. Called
+# under the write lock by whoever flushes; a marker whose writer is still
+# running is kept (it is waiting for the lock), unless it is a day old and
+# the PID has been reused.
+def remove_orphaned_markers():
+    for path in glob.glob(os.path.join(PENDING_DIR, "*.done")):
+        try:
+            pid = int(os.path.basename(path)[:-len(".done")].rsplit("-", 1)[1])
+            os.kill(pid, 0)
+            orphaned = datetime.now().timestamp() - os.path.getmtime(path) > 86400
+        except ProcessLookupError:
+            orphaned = True
+        except (IndexError, ValueError, OSError):
+            continue
+        if orphaned:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+# Source column names recognised for each ledger field when --map isn't given.
+# Bank statements often have no type column: either a signed amount
+# (negative = expense) or separate debit/credit columns.
+IMPORT_COLUMNS = {
+    "datetime": ["datetime", "date", "timestamp", "time", "transaction date", "booking date", "posted"],
+    "type": ["type", "kind"],
+    "amount": ["amount", "value", "sum"],
+    "category": ["category"],
+    "note": ["note", "notes", "description", "memo", "details", "payee", "merchant", "narrative"],
+    "debit": ["debit", "withdrawal", "money out", "paid out"],
+    "credit": ["credit", "deposit", "money in", "paid in"],
+}
+
+# Yields (line number, {column: value}) from a CSV or JSONL file
+def read_import_rows(path, fmt, delimiter=","):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_no, json.loads(line)
+        else:
+            reader = csv.DictReader(f, delimiter=delimiter)
+            for raw in reader:
+                yield reader.line_num, raw
+
+# Picks the source column for each field: explicit --map entries first, then
+# the first recognised header name
+def import_columns(names, mapping):
+    lower = {name.strip().lower(): name for name in names if name}
+    columns = {}
+    for field, aliases in IMPORT_COLUMNS.items():
+        if field in mapping:
+            columns[field] = mapping[field]
+            continue
+        for alias in aliases:
+            if alias in lower:
+                columns[field] = lower[alias]
+                break
+    if "datetime" not in columns:
+        raise ValueError("no date column found (use --map datetime=COLUMN)")
+    if "amount" not in columns and not ("debit" in columns or "credit" in columns):
+        raise ValueError("no amount column found (use --map amount=COLUMN)")
+    return columns
+
+def parse_import_amount(value):
+    value = str(value).strip()
+    try:
+        return to_minor(value)
+    except ValueError:
+        return to_minor(value.replace(",", ""))
+
+# One source row as an append_records tuple; raises ValueError if it can't be used
+def parse_import_row(raw, columns, date_format=None, default_category="uncategorized"):
+    value = str(raw.get(columns["datetime"]) or "").strip()
+    dt = datetime.strptime(value, date_format) if date_format else datetime.fromisoformat(value)
+    if dt.tzinfo:
+        dt = dt.astimezone().replace(tzinfo=None)
+    rec_type = str(raw.get(columns["type"]) or "").strip().lower() if "type" in columns else ""
+    if "amount" in columns and str(raw.get(columns["amount"]) or "").strip():
+        amount = parse_import_amount(raw[columns["amount"]])
+        if not rec_type:
+            rec_type = "expense" if amount < 0 else "income"
+            amount = abs(amount)
+    elif "debit" in columns and str(raw.get(columns["debit"]) or "").strip():
+        amount, rec_type = abs(parse_import_amount(raw[columns["debit"]])), rec_type or "expense"
+    elif "credit" in columns and str(raw.get(columns["credit"]) or "").strip():
+        amount, rec_type = abs(parse_import_amount(raw[columns["credit"]])), rec_type or "income"
+    else:
+        raise ValueError("no amount")
+    if rec_type not in ("expense", "income"):
+        raise ValueError(f"unknown type '{rec_type}'")
+    category = str(raw.get(columns.get("category")) or "").strip() or default_category
+    note = str(raw.get(columns.get("note")) or "").strip()
+    return dt, rec_type, amount, category, note
+
+# Budget alerts for the final totals of each month/category an import touched
+def import_budget_alerts(agg, budgets, affected):
     alerts = []
-    if rec_type == "expense":
-        alerts = check_budgets(amount, category, dt, budgets)
+    for month in sorted(affected):
+        if "monthly" in budgets:
+            total, limit = agg["months"].get(month, {}).get("expense", 0), to_minor(budgets["monthly"])
+            if total > limit:
+                alerts.append(f"[bold red]🚨 Monthly budget exceeded in {month}! ({format_minor(total)}/{format_minor(limit)})[/]")
+            elif 10 * total > 9 * limit:
+                alerts.append(f"[red]⚠️ Near monthly budget in {month}! ({format_minor(total)}/{format_minor(limit)})[/]")
+        spent = agg["categories"].get(month, {}).get("expense", {})
+        for category in sorted(affected[month]):
+            if category not in budgets.get("categories", {}):
+                continue
+            total, limit = spent.get(category, 0), to_minor(budgets["categories"][category])
+            if total > limit:
+                alerts.append(f"[bold red]🚨 {category} budget exceeded in {month}! ({format_minor(total)}/{format_minor(limit)})[/]")
+            elif 10 * total > 9 * limit:
+                alerts.append(f"[red]⚠️ Near {category} budget in {month}! ({format_minor(total)}/{format_minor(limit)})[/]")
+    return alerts
+
+def import_records(path, fmt=None, mapping=None, date_format=None, category="uncategorized", delimiter=","):
+    fmt = fmt or ("jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv")
+    started = datetime.now()
+    imported = skipped = 0
+    errors = []
+    affected = {}
+    batch = []
     try:
-        with open(CSV_FILE, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([dt.isoformat(), rec_type, amount, category, note])
+        rows = read_import_rows(path, fmt, delimiter)
+        columns = None
+        for line_no, raw in rows:
+            if columns is None or fmt == "jsonl" and not set(columns.values()) <= raw.keys():
+                columns = import_columns(raw.keys(), mapping or {})
+            try:
+                record = parse_import_row(raw, columns, date_format, category)
+            except (ValueError, TypeError, AttributeError) as e:
+                skipped += 1
+                if len(errors) < 5:
+                    errors.append(f"line {line_no}: {e}")
+                continue
+            batch.append(record)
+            if record[1] == "expense":
+                affected.setdefault(get_month(record[0]), set()).add(record[3])
+            if len(batch) >= IMPORT_BATCH:
+                append_records(batch, alerts=False)
+                imported += len(batch)
+                batch = []
+        if batch:
+            append_records(batch, alerts=False)
+            imported += len(batch)
+    except Exception as e:
+        console.print(f"[red]Import failed after {imported} records: {e}[/]")
+        return
+    elapsed = max((datetime.now() - started).total_seconds(), 1e-6)
+    console.print(f"[green]Imported {imported} records from {path} in {elapsed:.2f}s ({imported / elapsed:,.0f} rows/s)[/]")
+    if skipped:
+        console.print(f"[yellow]Skipped {skipped} rows that could not be read:[/]")
+        for error in errors:
+            console.print(f"[yellow]  {error}[/]")
+    for alert in import_budget_alerts(load_aggregates(), load_json(BUDGET_FILE, {}), affected):
+        console.print(alert)
+
+# amount is in minor units (see to_minor)
+def add_record(rec_type: str, amount: int, category: str, note: str):
+    try:
+        alerts = group_append([(datetime.now(), rec_type, amount, category, note)])
         emoji = "💸" if rec_type == "expense" else "💰"
-        console.print(f"{emoji} Logged {amount} as [bold]{rec_type}[/] in [bold]{category}[/]")
+        console.print(f"{emoji} Logged {format_minor(amount)} as [bold]{rec_type}[/] in [bold]{category}[/]")
         for alert in alerts:
             console.print(alert)
     except Exception as e:
         console.print(f"[red]Error logging record: {e}[/]")
 
+@write_lock()
 def set_budget(monthly=None, category=None, amount=None):
     budgets = load_json(BUDGET_FILE, {})
     if monthly is not None:
-        budgets["monthly"] = monthly
-        console.print(f"[green]Set monthly budget to {monthly}[/]")
+        budgets["monthly"] = to_major(monthly)
+        console.print(f"[green]Set monthly budget to {format_minor(monthly)}[/]")
     if category and amount is not None:
         if "categories" not in budgets:
             budgets["categories"] = {}
-        budgets["categories"][category] = amount
-        console.print(f"[green]Set budget for [bold]{category}[/] to {amount}[/]")
+        budgets["categories"][category] = to_major(amount)
+        console.print(f"[green]Set budget for [bold]{category}[/] to {format_minor(amount)}[/]")
     save_json(BUDGET_FILE, budgets)
 
 def show_budgets():
+    from rich import box
+    from rich.table import Table
     budgets = load_json(BUDGET_FILE, {})
     table = Table(title="Budgets", box=box.ROUNDED)
     table.add_column("Type")
     table.add_column("Category")
     table.add_column("Limit", justify="right")
     if "monthly" in budgets:
-        table.add_row("Monthly", "-", str(budgets["monthly"]))
+        table.add_row("Monthly", "-", amount_text(budgets["monthly"]))
     if "categories" in budgets:
         for cat, amt in budgets["categories"].items():
-            table.add_row("Category", cat, str(amt))
+            table.add_row("Category", cat, amount_text(amt))
     console.print(table)
 
+@write_lock()
 def add_recurring(rec_type, amount, category, note, day):
     recurs = load_json(RECUR_FILE, [])
-    recurs.append({
+    recur = {
         "type": rec_type,
-        "amount": amount,
+        "amount": to_major(amount),
         "category": category,
         "note": note,
         "day": day
-    })
+    }
+    recurs.append(recur)
     save_json(RECUR_FILE, recurs)
-    console.print(f"[green]Added recurring {rec_type} of {amount} in {category} on day {day}[/]")
+    # A new rule starts from yesterday: it logs today if today is its day
+    state = load_json(RECUR_STATE_FILE, {})
+    state[recurring_key(recur)] = (date.today() - timedelta(days=1)).isoformat()
+    save_recurring_state(recurs, state)
+    console.print(f"[green]Added recurring {rec_type} of {format_minor(amount)} in {category} on day {day}[/]")
+
+# Dates in (after, until] on which a rule for day-of-month `day` falls due.
+# Days past the end of a month fall on its last day.
+def recurring_due_dates(day, after, until):
+    dues = []
+    year, month = after.year, after.month
+    while (year, month) <= (until.year, until.month):
+        due = date(year, month, min(day, calendar.monthrange(year, month)[1]))
+        if after < due <= until:
+            dues.append(due)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return dues
+
+# The date each rule was last applied is derived state, kept in
+# data/cache/recurring_state.json keyed by the rule's fields (editing a rule
+# makes it a new one), so data/recurring.json stays as the user wrote it.
+def recurring_key(recur):
+    return json.dumps([recur.get(field) for field in ("type", "amount", "category", "note", "day")])
+
+def save_recurring_state(recurs, state):
+    keys = {recurring_key(recur) for recur in recurs}
+    os.makedirs(os.path.dirname(RECUR_STATE_FILE), exist_ok=True)
+    save_json(RECUR_STATE_FILE, {key: last for key, last in state.items() if key in keys})
+
+# Where rules without a marker (written by hand, saved before markers
+# existed, or after data/cache/ was deleted) start: the date of the latest
+# record in the ledger the rule would have logged, so days missed since then
+# are caught up; a rule that never logged anything starts from yesterday,
+# since there is no telling when it was written.
+def recurring_starts(recurs, today):
+    found = {}
+    wanted = {}
+    for recur in recurs:
+        try:
+            wanted[(recur["type"], to_minor(recur["amount"]), recur["category"], recur["note"])] = recurring_key(recur)
+        except Exception:
+            continue
+    if wanted:
+        malformed = []
+        for i, row in iter_records():
+            try:
+                rec = decode_row(row)
+            except ROW_ERRORS:
+                malformed.append(i)
+                continue
+            key = wanted.get((rec.type, rec.amount, rec.category, rec.note))
+            if key is not None and rec.dt.date() <= today and (key not in found or rec.dt.date() > found[key]):
+                found[key] = rec.dt.date()
+        if malformed:
+            note_malformed("looking up recurring transactions", malformed)
+    yesterday = today - timedelta(days=1)
+    return {recurring_key(recur): found.get(recurring_key(recur), yesterday).isoformat() for recur in recurs}
 
+_recurring_checked_on = None
+
+# Log due recurring transactions. Reads only the rules and their markers (the
+# ledger just once for rules that have none) and runs at most once per day
+# per process.
 def process_recurring():
-    recurs = load_json(RECUR_FILE, [])
+    global _recurring_checked_on
     today = date.today()
-    ensure_csv()
-    added = 0
+    if _recurring_checked_on == today:
+        return
+    _recurring_checked_on = today
+    # Most days nothing is due; only take the write lock when something is
+    state = load_json(RECUR_STATE_FILE, {})
+    if not any(recurring_pending(recur, state, today) for recur in load_json(RECUR_FILE, [])):
+        return
+    with write_lock():
+        apply_recurring(today)
+
+def recurring_pending(recur, state, today):
+    try:
+        last = state.get(recurring_key(recur))
+        return not last or bool(recurring_due_dates(int(recur["day"]), date.fromisoformat(last), today))
+    except Exception:
+        return False
+
+def apply_recurring(today):
+    recurs = load_json(RECUR_FILE, [])
+    state = load_json(RECUR_STATE_FILE, {})
+    unmarked = [recur for recur in recurs if recurring_key(recur) not in state]
+    if unmarked:
+        state.update(recurring_starts(unmarked, today))
+    now = datetime.now()
+    rows = []
+    applied = {}
     for recur in recurs:
         try:
-            recur_day = int(recur["day"])
-            if today.day == recur_day:
-                already = False
-                with open(CSV_FILE) as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        rdt = datetime.fromisoformat(row["datetime"])
-                        if (rdt.date() == today and
-                            row["type"] == recur["type"] and
-                            row["category"] == recur["category"] and
-                            float(row["amount"]) == float(recur["amount"]) and
-                            row["note"] == recur["note"]):
-                            already = True
-                            break
-                if not already:
-                    add_record(recur["type"], float(recur["amount"]), recur["category"], recur["note"])
-                    added += 1
+            key = recurring_key(recur)
+            amount = to_minor(recur["amount"])
+            # Identical rules share a marker and each logs its dues
+            dues = applied.get(key) or recurring_due_dates(int(recur["day"]), date.fromisoformat(state[key]), today)
+            for due in dues:
+                dt = now if due == today else datetime.combine(due, time())
+                rows.append((dt, recur["type"], amount, recur["category"], recur["note"]))
+            applied[key] = dues
         except Exception:
             continue
-    if added:
-        console.print(f"[cyan]{added} recurring transactions processed.[/]")
+    alerts = []
+    if rows:
+        try:
+            alerts = append_records(rows)
+        except Exception as e:
+            console.print(f"[red]Error logging recurring transactions: {e}[/]")
+            return
+    for key, dues in applied.items():
+        if dues:
+            state[key] = today.isoformat()
+    if unmarked or any(applied.values()):
+        save_recurring_state(recurs, state)
+    if rows:
+        console.print(f"[cyan]{len(rows)} recurring transactions processed.[/]")
+        for alert in alerts:
+            console.print(alert)
+
+# Totals grouped by "type_category", "category" or "month", computed by the active backend
+def ledger_totals(by, filter_type=None, filter_category=None, date_from=None, date_to=None):
+    with phase("aggregate"):
+        source = ledger_source()
+        if SCAN_JOBS is not None and not isinstance(source, CsvStore):
+            console.print("[yellow]--jobs only applies when scanning records.csv with the csv backend; ignored.[/]")
+        deleted, patches = load_journal()
+        # Journaled rows are left out of the base scan and patched rows re-added
+        exclude = (deleted | set(patches)) or None
+        totals = source.totals(by, filter_type, filter_category, date_from, date_to, exclude)
+        if archive_segments():
+            for key, value in archive_totals(by, filter_type, filter_category, date_from, date_to, exclude).items():
+                totals[key] = totals.get(key, 0) + value
+        if exclude:
+            patched = [dict(row, **patches[i]) for i, row in base_rows_by_id(list(patches)).items()]
+            for key, value in totals_from_rows(patched, by, filter_type, filter_category, date_from, date_to).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
 
-def summary(filter_type=None, filter_category=None, date_from=None, date_to=None):
-    ensure_csv()
-    table = Table(title="Summary by Category & Type", box=box.ROUNDED, style="cyan")
+def summary(filter_type=None, filter_category=None, date_from=None, date_to=None, currency=None):
+    from rich import box
+    from rich.table import Table
+    title = "Summary by Category & Type"
+    rate, digits = 1.0, money_digits()
+    if currency:
+        currency = currency.upper()
+        try:
+            rate = exchange_rate(home_currency(), currency)
+        except Exception as e:
+            console.print(f"[red]Currency conversion error: {e}[/]")
+            return
+        if rate is None:
+            console.print(f"[red]Conversion failed from {home_currency()} to {currency}.[/]")
+            return
+        title += f" ({currency})"
+        rate, digits = rate * 10 ** (currency_digits(currency) - digits), currency_digits(currency)
+    table = Table(title=title, box=box.ROUNDED, style="cyan")
     table.add_column("Type", style="bold")
     table.add_column("Category")
     table.add_column("Total", justify="right")
-    totals = {}
     try:
-        with open(CSV_FILE) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if filter_type and row["type"] != filter_type:
-                    continue
-                if filter_category and row["category"] != filter_category:
-                    continue
-                if date_from or date_to:
-                    try:
-                        dt = datetime.fromisoformat(row["datetime"])
-                    except Exception:
-                        continue
-                    if date_from and dt < date_from:
-                        continue
-                    if date_to and dt > date_to:
-                        continue
-                key = (row["type"], row["category"])
-                totals[key] = totals.get(key, 0) + float(row["amount"])
-        for (typ, cat), tot in sorted(totals.items()):
-            table.add_row(typ, cat, f"{tot:.2f}")
-        console.print(table)
+        totals = ledger_totals("type_category", filter_type, filter_category, date_from, date_to)
+        with phase("render"):
+            for (typ, cat), tot in sorted(totals.items()):
+                table.add_row(typ, cat, format_minor(round(tot * rate), digits))
+            console.print(table)
     except Exception as e:
         console.print(f"[red]Error reading summary: {e}[/]")
 
 def graph(filter_type=None, filter_category=None, by="month"):
-    ensure_csv()
     if filter_type is None:
         filter_type = "expense"
     if by == "category":
-        cat_totals = {}
         try:
-            with open(CSV_FILE) as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if filter_type and row["type"] != filter_type:
-                        continue
-                    if filter_category and row["category"] != filter_category:
-                        continue
-                    cat = row["category"]
-                    cat_totals[cat] = cat_totals.get(cat, 0) + float(row["amount"])
+            cat_totals = ledger_totals("category", filter_type, filter_category)
             if not cat_totals:
                 console.print("[yellow]No data to graph.[/]")
                 return
             max_val = max(cat_totals.values())
             bar_width = 40
             console.print(f"[bold cyan]Totals by category for type={filter_type}[/bold cyan]")
-            for cat, v in sorted(cat_totals.items(), key=lambda x: -x[1]):
-                bar_len = int((v / max_val) * bar_width) if max_val > 0 else 0
-                bar = "█" * bar_len
-                console.print(f"{cat:15} | {bar} {v:.2f}")
+            with phase("render"):
+                for cat, v in sorted(cat_totals.items(), key=lambda x: -x[1]):
+                    bar_len = int((v / max_val) * bar_width) if max_val > 0 else 0
+                    bar = "█" * bar_len
+                    console.print(f"{cat:15} | {bar} {format_minor(v)}")
         except Exception as e:
             console.print(f"[red]Error generating graph: {e}[/]")
     else:
-        monthly = {}
         try:
-            with open(CSV_FILE) as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if filter_type and row["type"] != filter_type:
-                        continue
-                    if filter_category and row["category"] != filter_category:
-                        continue
-                    try:
-                        dt = datetime.fromisoformat(row["datetime"])
-                    except Exception:
-                        continue
-                    month = dt.strftime("%Y-%m")
-                    monthly[month] = monthly.get(month, 0) + float(row["amount"])
+            monthly = ledger_totals("month", filter_type, filter_category)
             if not monthly:
                 console.print("[yellow]No data to graph.[/]")
                 return
@@ -251,150 +2217,818 @@ def graph(filter_type=None, filter_category=None, by="month"):
             max_val = max(vals)
             bar_width = 40
             console.print(f"[bold cyan]Monthly totals for type={filter_type}, category={filter_category or 'any'}[/bold cyan]")
-            for m in months:
-                v = monthly[m]
-                bar_len = int((v / max_val) * bar_width) if max_val > 0 else 0
-                bar = "█" * bar_len
-                console.print(f"{m} | {bar} {v:.2f}")
+            with phase("render"):
+                for m in months:
+                    v = monthly[m]
+                    bar_len = int((v / max_val) * bar_width) if max_val > 0 else 0
+                    bar = "█" * bar_len
+                    console.print(f"{m} | {bar} {format_minor(v)}")
         except Exception as e:
             console.print(f"[red]Error generating graph: {e}[/]")
 
-def list_records(filter_type=None, filter_category=None, date_from=None, date_to=None, min_amount=None, max_amount=None):
-    ensure_csv()
-    table = Table(title="All Records", box=box.SIMPLE_HEAVY)
+DASHBOARD_MONTHS = 6
+DASHBOARD_REFRESH = 2.0
+
+# Per-month/per-category rollups for the dashboard, kept in memory. They start
+# from the aggregate index and then follow records.csv from the last byte
+# offset they read, so each refresh only parses rows appended since. Any other
+# change (edits, deletes, another backend, a rewritten file) reloads them
+# from the aggregate index.
+class Rollups:
+    def __init__(self):
+        self.rows_read = 0
+        self.reload()
+
+    def reload(self):
+        self.agg = load_aggregates()
+        self.signature = ledger_signature()
+        self.source = self.signature[:2]
+        self.offset, self.tail = None, b""
+        store = get_store()
+        if store.name == "csv" and store.signature():
+            self.offset = os.path.getsize(store.path)
+            self.tail = store.read_bytes(max(0, self.offset - 64), self.offset)
+
+    # Brings the rollups up to date; returns the number of new rows folded in
+    def refresh(self):
+        signature = ledger_signature()
+        if signature == self.signature:
+            return 0
+        store = get_store()
+        size = signature[2] if store.name == "csv" and len(signature) > 2 else None
+        if (self.offset is None or size is None or size < self.offset or signature[:2] != self.source
+                or store.read_bytes(self.offset - len(self.tail), self.offset) != self.tail):
+            self.reload()
+            return 0
+        chunk = store.read_bytes(self.offset, size)
+        # Only whole rows: stop at the last newline that isn't inside quotes
+        end = len(chunk)
+        while end and (chunk[end - 1:end] != b"\n" or chunk[:end].count(b'"') % 2):
+            end = chunk.rfind(b"\n", 0, end - 1) + 1
+        count = 0
+        for values in csv.reader(io.StringIO(chunk[:end].decode("utf-8"), newline="")):
+            if values:
+                update_aggregates(self.agg, dict(zip(RECORD_FIELDS, values)))
+                count += 1
+        self.offset += end
+        self.tail = store.read_bytes(max(0, self.offset - 64), self.offset)
+        # A half-written row at the end is picked up on the next refresh
+        self.signature = signature if end == len(chunk) else None
+        self.rows_read += count
+        return count
+
+# refresh=None renders a one-off frame
+def dashboard_view(rollups, months=DASHBOARD_MONTHS, refresh=None):
+    from rich import box
+    from rich.console import Group
+    from rich.panel import Panel
+    from rich.progress_bar import ProgressBar
+    from rich.table import Table
+    agg = rollups.agg
+    now = datetime.now()
+    month = get_month(now)
+    budgets = load_json(BUDGET_FILE, {})
+    spent = agg["categories"].get(month, {}).get("expense", {})
+
+    usage = Table(title=f"Budgets for {month}", box=box.ROUNDED, expand=True)
+    usage.add_column("Budget")
+    usage.add_column("Used", ratio=1)
+    usage.add_column("Spent", justify="right")
+    usage.add_column("Limit", justify="right")
+    usage.add_column("%", justify="right")
+    limits = []
+    if "monthly" in budgets:
+        limits.append(("Monthly", agg["months"].get(month, {}).get("expense", 0), budgets["monthly"]))
+    for cat, limit in sorted(budgets.get("categories", {}).items()):
+        limits.append((cat, spent.get(cat, 0), limit))
+    for name, total, limit in limits:
+        limit = to_minor(limit)
+        share = total / limit if limit > 0 else 0
+        style = "red" if share > 1 else "yellow" if share > 0.9 else "green"
+        usage.add_row(name, ProgressBar(total=max(limit, 1), completed=min(total, limit), complete_style=style, finished_style=style),
+                      format_minor(total), format_minor(limit), f"[{style}]{share:.0%}[/]")
+    if not limits:
+        usage.add_row("[dim]No budgets set (see set-budget)[/]", "", "", "", "")
+
+    trend = Table(title=f"Last {months} months", box=box.ROUNDED, expand=True)
+    trend.add_column("Month")
+    trend.add_column("Income", justify="right", style="green")
+    trend.add_column("Expense", justify="right", style="red")
+    trend.add_column("Net", justify="right")
+    for m in sorted(agg["months"])[-months:]:
+        types = agg["months"][m]
+        income, expense = types.get("income", 0), types.get("expense", 0)
+        trend.add_row(m, format_minor(income), format_minor(expense),
+                      f"[{'green' if income >= expense else 'red'}]{format_minor(income - expense)}[/]")
+
+    categories = Table(title=f"Spending by category in {month}", box=box.ROUNDED, expand=True)
+    categories.add_column("Category")
+    categories.add_column("Share", ratio=1)
+    categories.add_column("Spent", justify="right")
+    top = max(spent.values(), default=0)
+    for cat, total in sorted(spent.items(), key=lambda c: -c[1]):
+        categories.add_row(cat, ProgressBar(total=max(top, 1), completed=max(total, 0), complete_style="cyan"), format_minor(total))
+
+    footer = f"[dim]Updated {now:%H:%M:%S}"
+    if refresh:
+        footer += f" · {rollups.rows_read} new rows read · refreshing every {refresh:g}s · Ctrl-C to quit"
+    footer += "[/]"
+    return Panel(Group(usage, trend, categories, footer), title="TBudget Dashboard", border_style="cyan")
+
+# Live budget dashboard. Each tick folds in only the rows appended since the
+# last one; --once prints a single frame (for scripts and the daemon).
+def dashboard(months=DASHBOARD_MONTHS, refresh=DASHBOARD_REFRESH, once=False):
+    if months < 1 or refresh <= 0:
+        console.print("[red]--months and --refresh must be positive.[/]")
+        return
+    rollups = Rollups()
+    if once:
+        console.print(dashboard_view(rollups, months))
+        return
+    import time as clock
+    from rich.live import Live
+    try:
+        with Live(dashboard_view(rollups, months, refresh), console=console, auto_refresh=False, screen=False) as live:
+            while True:
+                clock.sleep(refresh)
+                rollups.refresh()
+                live.update(dashboard_view(rollups, months, refresh), refresh=True)
+    except KeyboardInterrupt:
+        pass
+
+FORECAST_FILE = os.path.join(DATA_DIR, "cache", "forecast.json")
+FORECAST_HISTORY = 6
+FORECAST_MONTHS = 3
+
+def add_months(month, n):
+    year, m = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + n, 12)
+    return f"{year:04d}-{m + 1:02d}"
+
+# Expense per category in each of the `count` complete months before `month`,
+# oldest first. Months before the first recorded one are left out, so a young
+# ledger isn't pulled towards zero.
+def forecast_history(agg, month, count=FORECAST_HISTORY):
+    first = min(agg["months"], default=month)
+    months = [m for m in (add_months(month, -i) for i in range(count, 0, -1)) if m >= first]
+    spent = [agg["categories"].get(m, {}).get("expense", {}) for m in months]
+    cats = sorted({cat for cats in spent for cat in cats})
+    return months, {cat: [cats.get(cat, 0) for cats in spent] for cat in cats}
+
+# Expense the recurring rules will log in each month, by category, counting
+# only dues after `today`
+def recurring_schedule(recurs, today, months):
+    year, month = int(months[-1][:4]), int(months[-1][5:7])
+    until = date(year, month, calendar.monthrange(year, month)[1])
+    schedule = {m: {} for m in months}
+    for recur in recurs:
+        try:
+            if recur["type"] != "expense":
+                continue
+            amount = to_minor(recur["amount"])
+            for due in recurring_due_dates(int(recur["day"]), today, until):
+                cats = schedule[get_month(due)]
+                cats[recur["category"]] = cats.get(recur["category"], 0) + amount
+        except Exception:
+            continue
+    return schedule
+
+# Least-squares line through each history row (one per category), evaluated
+# for the `steps` months after the last one. With NumPy the fit runs over the
+# whole matrix at once; both paths round the same way. Estimates never go
+# below zero.
+def trend_estimates(history, steps):
+    if not history:
+        return []
+    n = len(history[0])
+    xs = [x - (n - 1) / 2 for x in range(n)]
+    sxx = sum(x * x for x in xs) or 1
+    ahead = [(n - 1) / 2 + s for s in range(1, steps + 1)]
+    np = load_numpy()
+    if np is not None:
+        h = np.asarray(history, dtype=np.float64)
+        mean = h.mean(axis=1, keepdims=True)
+        slope = (h - mean) @ np.asarray(xs) / sxx
+        estimates = mean + slope[:, None] * np.asarray(ahead)
+        return np.maximum(estimates, 0).round().astype(np.int64).tolist()
+    estimates = []
+    for row in history:
+        mean = sum(row) / n
+        slope = sum(x * (v - mean) for x, v in zip(xs, row)) / sxx
+        estimates.append([max(round(mean + slope * a), 0) for a in ahead])
+    return estimates
+
+# Projected expense for today's month and the `count` months after it.
+# "remaining" is what each category is still expected to spend this month
+# (recurring dues after today plus its trend for the days left), so callers
+# add it to the live month-to-date total; "future" holds whole months. The
+# trend is fitted to the spending the recurring rules don't explain.
+def build_projection(agg, today, count, recurs):
+    month = get_month(today)
+    _, history = forecast_history(agg, month)
+    months = [add_months(month, i) for i in range(count + 1)]
+    schedule = recurring_schedule(recurs, today, months)
+    # Every rule falls due once a month
+    rules = {}
+    for recur in recurs:
+        try:
+            if recur["type"] == "expense":
+                rules[recur["category"]] = rules.get(recur["category"], 0) + to_minor(recur["amount"])
+        except Exception:
+            continue
+    cats = sorted(history)
+    estimates = trend_estimates([[max(v - rules.get(cat, 0), 0) for v in history[cat]] for cat in cats], count + 1)
+    days = calendar.monthrange(today.year, today.month)[1]
+    left = (days - today.day) / days
+    remaining = {cat: round(est[0] * left) for cat, est in zip(cats, estimates)}
+    future = {m: {cat: est[i] for cat, est in zip(cats, estimates)} for i, m in enumerate(months[1:], 1)}
+    for m, cats in schedule.items():
+        target = remaining if m == month else future[m]
+        for cat, amount in cats.items():
+            target[cat] = target.get(cat, 0) + amount
+    return {"month": month, "months": count, "remaining": remaining, "future": future}
+
+# Everything a projection is computed from: the day, the currency, the
+# recurring rules file and the complete months it fits the trend to. Adds to
+# the current month don't change it.
+def forecast_key(agg, today):
+    try:
+        st = os.stat(RECUR_FILE)
+        rules = [st.st_size, st.st_mtime_ns]
+    except OSError:
+        rules = None
+    return [today.isoformat(), money_digits(), rules, list(forecast_history(agg, get_month(today)))]
+
+# The cached projection in data/cache/forecast.json, recomputed when its key
+# changes (normally once a day) or fewer than `count` months are cached
+def load_projection(agg, count=0, today=None):
+    today = today or date.today()
+    key = forecast_key(agg, today)
+    cached = load_json(FORECAST_FILE, None)
+    if isinstance(cached, dict) and cached.get("key") == key and cached.get("months", -1) >= count:
+        return cached
+    with phase("index"):
+        projection = build_projection(agg, today, max(count, FORECAST_MONTHS), load_json(RECUR_FILE, []))
+        projection["key"] = key
+        os.makedirs(os.path.dirname(FORECAST_FILE), exist_ok=True)
+        save_json(FORECAST_FILE, projection, sync=False)
+    return projection
+
+def forecast_cell(value, limit):
+    if limit is None:
+        return format_minor(value)
+    style = "bold red" if value > limit else "yellow" if 10 * value > 9 * limit else "green"
+    return f"[{style}]{format_minor(value)}[/]"
+
+# Month-to-date spend, the end-of-month projection and `months` projected
+# months per category, checked against the budgets
+def forecast(months=FORECAST_MONTHS, category=None):
+    if months < 0:
+        console.print("[red]--months can't be negative.[/]")
+        return
+    from rich import box
+    from rich.table import Table
+    agg = load_aggregates()
+    projection = load_projection(agg, months)
+    month = projection["month"]
+    ahead = [add_months(month, i) for i in range(1, months + 1)]
+    budgets = load_json(BUDGET_FILE, {})
+    limits = {cat: to_minor(limit) for cat, limit in budgets.get("categories", {}).items()}
+    spent = agg["categories"].get(month, {}).get("expense", {})
+    cats = set(spent) | set(projection["remaining"]) | set(limits)
+    for m in ahead:
+        cats |= set(projection["future"][m])
+    cats = [category] if category else sorted(cats)
+
+    table = Table(title=f"Spending forecast for {month}" + (f" and the next {months} month{'s' * (months > 1)}" if months else ""), box=box.ROUNDED)
+    table.add_column("Category")
+    table.add_column("Spent", justify="right")
+    table.add_column("Projected", justify="right")
+    table.add_column("Budget", justify="right")
+    for m in ahead:
+        table.add_column(m, justify="right")
+    overruns = []
+    for cat in cats:
+        limit = limits.get(cat)
+        end = spent.get(cat, 0) + projection["remaining"].get(cat, 0)
+        values = [end] + [projection["future"][m].get(cat, 0) for m in ahead]
+        table.add_row(cat, format_minor(spent.get(cat, 0)), forecast_cell(values[0], limit),
+                      format_minor(limit) if limit is not None else "-", *[forecast_cell(v, limit) for v in values[1:]])
+        if limit is not None:
+            overruns += [next(((cat, m, v, limit) for m, v in zip([month] + ahead, values) if v > limit), None)]
+    if not category:
+        limit = to_minor(budgets["monthly"]) if "monthly" in budgets else None
+        total = agg["months"].get(month, {}).get("expense", 0)
+        values = [total + sum(projection["remaining"].values())] + [sum(projection["future"][m].values()) for m in ahead]
+        table.add_section()
+        table.add_row("[bold]Total[/]", format_minor(total), forecast_cell(values[0], limit),
+                      format_minor(limit) if limit is not None else "-", *[forecast_cell(v, limit) for v in values[1:]])
+        if limit is not None:
+            overruns += [next((("Monthly", m, v, limit) for m, v in zip([month] + ahead, values) if v > limit), None)]
+    console.print(table)
+    console.print(f"[dim]Recurring rules plus a linear trend over the last {FORECAST_HISTORY} complete months of other spending.[/]")
+    # The first projected month over each budget
+    for name, m, value, limit in filter(None, overruns):
+        console.print(f"[red]📈 {name} is projected to exceed its budget in {m} ({format_minor(value)}/{format_minor(limit)})[/]")
+
+LIST_SORT_KEYS = ["id", "datetime", "amount", "category", "type"]
+LIST_PAGE_SIZE = 50
+
+# Yields (id, Record) for records matching the list filters, straight off the store
+# Rows with an unreadable datetime or amount are listed as stored, unless a
+# date/amount filter or the sort order (`sort`) needs the field they lack
+def filter_records(filter_type=None, filter_category=None, date_from=None, date_to=None, min_amount=None, max_amount=None, sort=None):
+    needs_date = bool(date_from or date_to) or sort == "datetime"
+    needs_amount = min_amount is not None or max_amount is not None or sort == "amount"
+    for idx, row in iter_records(date_from, date_to):
+        if filter_type and row["type"] != filter_type:
+            continue
+        if filter_category and row["category"] != filter_category:
+            continue
+        try:
+            # Rows outside the date range are dropped before their amount is parsed
+            dt = datetime.fromisoformat(row["datetime"])
+            if date_from and dt < date_from or date_to and dt > date_to:
+                continue
+            rec = decode_row(row, dt)
+        except ROW_ERRORS:
+            rec = partial_record(row)
+            if rec.dt is None and needs_date or rec.amount is None and needs_amount:
+                note_malformed("listing records", [idx])
+                continue
+            note_malformed("listing records", [idx], action="Found")
+        if min_amount is not None and rec.amount < min_amount:
+            continue
+        if max_amount is not None and rec.amount > max_amount:
+            continue
+        yield idx, rec
+
+# Orders records by one of LIST_SORT_KEYS. When only the first `keep` rows
+# will be shown, a bounded heap avoids holding the whole ledger in memory.
+def sort_records(records, field, reverse=False, keep=None):
+    if field == "id":
+        key = lambda rec: rec[0]
+    elif field == "amount":
+        key = lambda rec: rec[1].amount
+    else:
+        key = lambda rec: rec[1].row[field] or ""
+    if keep is not None:
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        return iter(pick(keep, records, key=key))
+    return iter(sorted(records, key=key, reverse=reverse))
+
+# Splits a record stream into lists of at most `size` rows
+def paginate(records, size):
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+# An amount as the ledger currency shows it; unreadable values are shown as stored
+def amount_text(value):
+    try:
+        return format_minor(to_minor(value))
+    except (AttributeError, ValueError):
+        return str(value)
+
+# records are (id, Record) pairs
+def record_table(title, records):
+    from rich import box
+    from rich.table import Table
+    table = Table(title=title, box=box.SIMPLE_HEAVY)
     table.add_column("ID", justify="right", style="bold yellow")
     for field in FIELDS:
         table.add_column(field.capitalize())
+    for idx, rec in records:
+        color = "red" if rec.type == "expense" else "green"
+        table.add_row(
+            str(idx),
+            display_time(rec),
+            f"[{color}]{rec.type}[/{color}]",
+            display_amount(rec),
+            rec.category,
+            rec.note
+        )
+    return table
+
+def list_records(filter_type=None, filter_category=None, date_from=None, date_to=None, min_amount=None, max_amount=None,
+                 sort=None, descending=False, page=None, page_size=None, limit=None, plain=False):
+    for flag, value in (("--page", page), ("--page-size", page_size), ("--limit", limit)):
+        if value is not None and value < 1:
+            console.print(f"[red]{flag} must be a positive number.[/]")
+            return
     try:
-        with open(CSV_FILE) as f:
-            reader = csv.DictReader(f)
-            for idx, row in enumerate(reader, 1):
-                if filter_type and row["type"] != filter_type:
-                    continue
-                if filter_category and row["category"] != filter_category:
-                    continue
-                if date_from or date_to:
-                    try:
-                        dt = datetime.fromisoformat(row["datetime"])
-                    except Exception:
-                        continue
-                    if date_from and dt < date_from:
-                        continue
-                    if date_to and dt > date_to:
-                        continue
-                try:
-                    amt = float(row["amount"])
-                except Exception:
-                    continue
-                if min_amount is not None and amt < min_amount:
-                    continue
-                if max_amount is not None and amt > max_amount:
-                    continue
-                color = "red" if row["type"] == "expense" else "green"
-                try:
-                    dt_disp = datetime.fromisoformat(row["datetime"]).strftime("%Y-%m-%d %H:%M")
-                except Exception:
-                    dt_disp = row["datetime"]
-                table.add_row(
-                    str(idx),
-                    dt_disp,
-                    f"[{color}]{row['type']}[/{color}]",
-                    row["amount"],
-                    row["category"],
-                    row["note"]
-                )
-        console.print(table)
+        records = filter_records(filter_type, filter_category, date_from, date_to, min_amount, max_amount, sort)
+        if PROFILE:
+            records = PROFILE.iterate("filter", records, "rows_listed")
+        if page is not None and page_size is None:
+            page_size = LIST_PAGE_SIZE
+        start = (page - 1) * page_size if page is not None else 0
+        stop = start + page_size if page is not None else None
+        if limit is not None:
+            stop = min(stop, start + limit) if stop is not None else start + limit
+        if sort:
+            records = sort_records(records, sort, descending, keep=stop)
+        if start or stop is not None:
+            records = islice(records, start, stop)
+        with phase("render"):
+            if plain:
+                # Tab-separated rows go straight to stdout as they are read, no Rich rendering
+                writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+                writer.writerow(RECORD_FIELDS)
+                for idx, rec in records:
+                    writer.writerow([idx, rec.row["datetime"], rec.type, display_amount(rec), rec.category, rec.note])
+                sys.stdout.flush()
+            elif page is not None:
+                console.print(record_table(f"All Records (page {page})", records))
+            elif page_size:
+                # Print each page as soon as it is filled instead of building one huge table
+                for n, chunk in enumerate(paginate(records, page_size), 1):
+                    console.print(record_table(f"All Records (page {n})", chunk))
+            else:
+                console.print(record_table("All Records", records))
+    except BrokenPipeError:
+        # `list --plain | head` closes the pipe early; that is not an error.
+        # Point stdout at devnull so the interpreter's final flush stays quiet.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
     except Exception as e:
         console.print(f"[red]Error listing records: {e}[/]")
 
+# Checks that an edited field still holds a value the ledger can store
+def valid_field_value(field, value):
+    try:
+        if field == "datetime":
+            datetime.fromisoformat(value)
+        elif field == "amount":
+            to_minor(value)
+    except ValueError:
+        return False
+    return True
+
+@write_lock()
 def delete_record(record_id):
-    ensure_csv()
-    rows = []
-    deleted = False
-    with open(CSV_FILE) as f:
-        reader = csv.DictReader(f)
-        for i, row in enumerate(reader, 1):
-            if i == record_id:
-                deleted = True
-                continue
-            rows.append(row)
-    if deleted:
-        with open(CSV_FILE, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=FIELDS)
-            writer.writeheader()
-            writer.writerows(rows)
-        console.print(f"[green]Deleted record #{record_id}.[/]")
-    else:
+    agg = load_aggregates()
+    row = get_record(record_id)
+    if row is None:
         console.print(f"[red]Record #{record_id} not found.[/]")
+        return
+    search_db = open_search_index()
+    append_journal({"op": "delete", "id": record_id})
+    commit_search_index(search_db)
+    update_aggregates(agg, row, -1)
+    save_aggregates(agg)
+    console.print(f"[green]Deleted record #{record_id}.[/]")
 
+@write_lock()
 def edit_record(record_id, field, value):
-    ensure_csv()
-    rows = []
-    edited = False
-    with open(CSV_FILE) as f:
-        reader = csv.DictReader(f)
-        for i, row in enumerate(reader, 1):
-            if i == record_id:
-                if field in FIELDS:
-                    row[field] = value
-                    edited = True
-            rows.append(row)
-    if edited:
-        with open(CSV_FILE, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=FIELDS)
-            writer.writeheader()
-            writer.writerows(rows)
-        console.print(f"[green]Edited record #{record_id}: set {field} to {value}.[/]")
-    else:
+    if field in FIELDS and not valid_field_value(field, value):
+        console.print(f"[red]Invalid {field} value: {value}[/]")
+        return
+    if field == "amount":
+        value = format_minor(to_minor(value))
+    agg = load_aggregates()
+    row = get_record(record_id) if field in FIELDS else None
+    if row is None:
         console.print(f"[red]Record #{record_id} not found or invalid field.[/]")
+        return
+    search_db = open_search_index()
+    append_journal({"op": "edit", "id": record_id, "field": field, "value": value})
+    commit_search_index(search_db, [dict(row, **{field: value})])
+    update_aggregates(agg, row, -1)
+    update_aggregates(agg, dict(row, **{field: value}))
+    save_aggregates(agg)
+    console.print(f"[green]Edited record #{record_id}: set {field} to {value}.[/]")
+
+# Archive of closed months (data/archive/YYYY-MM.seg), written by `archive`.
+# A segment holds the rows sealed from one month as gzip-compressed CSV,
+# followed by a JSON footer (row count, ID and datetime range, and totals per
+# month/type/category in minor units), the footer's length as 8 little-endian
+# bytes and SEGMENT_MAGIC. Segments are never changed in place, only replaced
+# whole, so totals are read from the footer without decompressing anything
+# and rows are decompressed only for the segments a query actually needs.
+SEGMENT_MAGIC = b"TBSEG1\n"
+
+class Segment:
+    def __init__(self, path, footer):
+        self.path = path
+        self.footer = footer
+        self.month = footer["month"]
+
+    @classmethod
+    def open(cls, path):
+        trailer = 8 + len(SEGMENT_MAGIC)
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(size - trailer)
+            tail = f.read()
+            if size < trailer or not tail.endswith(SEGMENT_MAGIC):
+                raise ValueError(f"{path} is not an archive segment")
+            length = int.from_bytes(tail[:8], "little")
+            f.seek(size - trailer - length)
+            footer = json.loads(f.read(length))
+        footer["body"] = size - trailer - length
+        return cls(path, footer)
+
+    def overlaps(self, date_from=None, date_to=None):
+        if date_from and datetime.fromisoformat(self.footer["max"]) < date_from:
+            return False
+        return not (date_to and datetime.fromisoformat(self.footer["min"]) > date_to)
 
-def search_records(keyword):
-    ensure_csv()
-    table = Table(title=f"Search Results for '{keyword}'", box=box.SIMPLE_HEAVY)
+    def inside(self, date_from=None, date_to=None):
+        return (not date_from or datetime.fromisoformat(self.footer["min"]) >= date_from) and \
+            (not date_to or datetime.fromisoformat(self.footer["max"]) <= date_to)
+
+    def iter_rows(self):
+        for values in self.iter_values():
+            yield dict(zip(RECORD_FIELDS, values))
+
+    # Rows as raw RECORD_FIELDS lists (see CsvStore.iter_values)
+    def iter_values(self):
+        import gzip
+        with open(self.path, "rb") as f:
+            body = f.read(self.footer["body"])
+        if PROFILE:
+            PROFILE.count("bytes_read", len(body))
+        yield from filter(None, csv.reader(io.StringIO(gzip.decompress(body).decode("utf-8"), newline="")))
+
+    def rows_by_id(self, ids):
+        wanted = {i for i in ids if self.footer["min_id"] <= i <= self.footer["max_id"]}
+        if not wanted:
+            return {}
+        return {record_id(row): row for row in self.iter_rows() if record_id(row) in wanted}
+
+# Writes rows (dicts) as the segment for `month`, replacing any old one
+def write_segment(month, rows):
+    import gzip
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    footer = {"month": month, "rows": 0, "min_id": None, "max_id": None, "min": None, "max": None,
+              "digits": money_digits(), "totals": {}}
+    for row in rows:
+        writer.writerow([row[f] for f in RECORD_FIELDS])
+        rid = record_id(row)
+        value = datetime.fromisoformat(row["datetime"]).isoformat()
+        footer["rows"] += 1
+        footer["min_id"] = min(footer["min_id"] or rid, rid)
+        footer["max_id"] = max(footer["max_id"] or rid, rid)
+        footer["min"] = min(footer["min"] or value, value)
+        footer["max"] = max(footer["max"] or value, value)
+        try:
+            amount = to_minor(row["amount"])
+        except ValueError:
+            continue
+        cats = footer["totals"].setdefault(value[:7], {}).setdefault(row["type"], {})
+        cats[row["category"]] = cats.get(row["category"], 0) + amount
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, month + ".seg")
+    footer_bytes = json.dumps(footer).encode("utf-8")
+    with open(path + ".tmp", "wb") as f:
+        f.write(gzip.compress(buf.getvalue().encode("utf-8"), compresslevel=9))
+        f.write(footer_bytes + len(footer_bytes).to_bytes(8, "little") + SEGMENT_MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+_segments = {}
+
+# Archive segments in month order; footers are read once per file version
+def archive_segments():
+    try:
+        entries = sorted((e for e in os.scandir(ARCHIVE_DIR) if e.name.endswith(".seg")), key=lambda e: e.name)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for entry in entries:
+        st = entry.stat()
+        key = (entry.path, st.st_size, st.st_mtime_ns)
+        if key not in _segments:
+            _segments[key] = Segment.open(entry.path)
+        segments.append(_segments[key])
+    return segments
+
+def archive_signature():
+    return [[os.path.basename(s.path), s.footer["body"], s.footer["rows"]] for s in archive_segments()]
+
+# Rows of the segments that can hold records between date_from and date_to
+def archived_rows(date_from=None, date_to=None):
+    for segment in archive_segments():
+        if segment.overlaps(date_from, date_to):
+            yield from segment.iter_rows()
+
+def archived_rows_by_id(ids):
+    found = {}
+    for segment in archive_segments():
+        found.update(segment.rows_by_id(ids))
+    return found
+
+# Group-by totals over the archive. Segments entirely inside the date range
+# come from their footers; the others, and rows left out by `exclude`, are
+# decompressed.
+def archive_totals(by, filter_type=None, filter_category=None, date_from=None, date_to=None, exclude=None):
+    totals = {}
+    def add(key, value):
+        totals[key] = totals.get(key, 0) + value
+    for segment in archive_segments():
+        if not segment.overlaps(date_from, date_to):
+            continue
+        if not segment.inside(date_from, date_to) or segment.footer["digits"] != money_digits():
+            for key, value in totals_from_rows(segment.iter_values(), by, filter_type, filter_category,
+                                               date_from, date_to, exclude).items():
+                add(key, value)
+            continue
+        for month, types in segment.footer["totals"].items():
+            fold_month_totals(add, month, types, by, filter_type, filter_category)
+        if exclude:
+            excluded = segment.rows_by_id(exclude).values()
+            for key, value in totals_from_rows(excluded, by, filter_type, filter_category, date_from, date_to).items():
+                add(key, -value)
+    return {key: value for key, value in totals.items() if value}
+
+# Feeds one month's {type: {category: total}} into add(key, value) for a group-by
+def fold_month_totals(add, month, types, by, filter_type=None, filter_category=None):
+    for typ, cats in types.items():
+        if filter_type and typ != filter_type:
+            continue
+        for cat, value in cats.items():
+            if filter_category and cat != filter_category:
+                continue
+            add(month if by == "month" else cat if by == "category" else (typ, cat), value)
+
+# Re-seals the segments holding records the journal deletes or edits, so the
+# journal can be cleared (compact, backend switches, archive)
+def fold_journal_into_archive(deleted, patches):
+    touched = set(deleted) | set(patches)
+    resealed = set()
+    for segment in archive_segments():
+        if not any(segment.footer["min_id"] <= i <= segment.footer["max_id"] for i in touched):
+            continue
+        rows = [dict(row, **patches.get(record_id(row), {})) for row in segment.iter_rows()
+                if record_id(row) not in deleted]
+        if rows:
+            write_segment(segment.month, rows)
+        else:
+            os.remove(segment.path)
+        resealed.add(segment.month)
+    return resealed
+
+# Seals every month before `before` (YYYY-MM, default: the current month)
+# into the archive and rewrites the active store with what is left. Pending
+# edits and deletes are folded in along the way, like compact. Segments are
+# written before the store is rewritten, so a crash in between can leave
+# rows in both places but never loses any.
+@write_lock()
+def archive_command(before=None, show=False):
+    if show:
+        archive_report(archive_segments())
+        return
+    before = before or get_month(datetime.now())
+    if not re.fullmatch(r"\d{4}-\d{2}", before):
+        console.print("[red]--before must be a month (YYYY-MM).[/]")
+        return
+    store = get_store()
+    hot, closed = [], {}
+    for _, row in iter_records(archived=False):
+        month = PartitionedStore.month_of(row["datetime"])
+        if month != UNDATED and month < before:
+            closed.setdefault(month, []).append(row)
+        else:
+            hot.append(row)
+    deleted, patches = load_journal()
+    if not closed and not deleted and not patches:
+        console.print(f"[yellow]Nothing to archive before {before}.[/]")
+        return
+    resealed = fold_journal_into_archive(deleted, patches)
+    existing = {segment.month: segment for segment in archive_segments()}
+    for month, rows in sorted(closed.items()):
+        if month in existing:
+            # Rows added later for an archived month are sealed in with it
+            rows = list(existing[month].iter_rows()) + rows
+        write_segment(month, rows)
+    store.rewrite(hot)
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    rebuild_aggregates()
+    if closed:
+        console.print(f"[green]Archived {sum(len(rows) for rows in closed.values())} records from "
+                      f"{len(closed)} months; {len(hot)} records stay in the active ledger.[/]")
+    if resealed:
+        console.print(f"[green]Applied pending edits and deletes to {len(resealed)} archived "
+                      f"month{'s' * (len(resealed) != 1)}.[/]")
+    if not closed and not resealed:
+        console.print(f"[green]Applied pending edits and deletes; {len(hot)} records in the active ledger.[/]")
+    # Only the months written by this run; a resealed month whose rows were
+    # all deleted has no segment left to show
+    segments = [s for s in archive_segments() if s.month in closed or s.month in resealed]
+    if segments:
+        archive_report(segments)
+
+def archive_report(segments):
+    from rich import box
+    from rich.table import Table
+    if not segments:
+        console.print("[yellow]The archive is empty.[/]")
+        return
+    table = Table(title="Archive", box=box.ROUNDED)
+    table.add_column("Month")
+    table.add_column("Records", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Expense", justify="right")
+    table.add_column("Income", justify="right")
+    for segment in segments:
+        totals = {}
+        for types in segment.footer["totals"].values():
+            for typ, cats in types.items():
+                totals[typ] = totals.get(typ, 0) + sum(cats.values())
+        table.add_row(segment.month, f"{segment.footer['rows']:,}", f"{os.path.getsize(segment.path) / 1024:,.1f} KB",
+                      format_minor(totals.get("expense", 0)), format_minor(totals.get("income", 0)))
+    console.print(table)
+
+# Fold the journal into the base ledger atomically and start a fresh journal.
+# Record IDs are kept.
+@write_lock()
+def compact_ledger():
+    deleted, patches = load_journal()
+    if not deleted and not patches:
+        console.print("[yellow]Nothing to compact.[/]")
+        return
+    store = get_store()
+    rows = [row for _, row in iter_records(archived=False)]
+    fold_journal_into_archive(deleted, patches)
+    store.rewrite(rows)
+    os.remove(JOURNAL_FILE)
+    rebuild_aggregates()
+    console.print(f"[green]Compacted {len(deleted)} deletions and {len(patches)} edits into {len(rows)} records.[/]")
+
+def show_record(record_id):
+    from rich import box
+    from rich.table import Table
+    row = get_record(record_id)
+    if row is None:
+        console.print(f"[red]Record #{record_id} not found.[/]")
+        return
+    values = {field: row[field] or "" for field in FIELDS}
+    try:
+        values["amount"] = format_minor(decode_row(row).amount)
+    except ROW_ERRORS:
+        # Shown anyway, so it can be fixed with edit
+        values["amount"] = amount_text(values["amount"])
+        note_malformed("showing a record", [record_id], action="Found")
+    table = Table(title=f"Record #{record_id}", box=box.ROUNDED)
+    table.add_column("Field", style="bold")
+    table.add_column("Value")
     for field in FIELDS:
-        table.add_column(field.capitalize())
-    found = False
-    with open(CSV_FILE) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if any(keyword.lower() in str(row[field]).lower() for field in FIELDS):
-                found = True
-                color = "red" if row["type"] == "expense" else "green"
-                try:
-                    dt_disp = datetime.fromisoformat(row["datetime"]).strftime("%Y-%m-%d %H:%M")
-                except Exception:
-                    dt_disp = row["datetime"]
-                table.add_row(
-                    dt_disp,
-                    f"[{color}]{row['type']}[/{color}]",
-                    row["amount"],
-                    row["category"],
-                    row["note"]
-                )
-    if found:
-        console.print(table)
+        table.add_row(field.capitalize(), values[field])
+    console.print(table)
+
+def search_records(keyword, limit=SEARCH_LIMIT):
+    matches, more = search_index_query(keyword, limit)
+    records = []
+    for rid, row in matches:
+        try:
+            records.append((rid, decode_row(row)))
+        except ROW_ERRORS:
+            records.append((rid, partial_record(row)))
+            note_malformed("searching", [rid], action="Found")
+    if records:
+        with phase("render"):
+            console.print(record_table(f"Search Results for '{keyword}'", records))
+        if more:
+            console.print(f"[yellow]Showing the first {limit} matches; use --limit to see more.[/]")
     else:
         console.print(f"[yellow]No records found for '{keyword}'.[/]")
 
 def help_cmd():
+    from rich.panel import Panel
     help_text = """
 [bold cyan]TBudget Help[/bold cyan]
 
 [bold]Commands:[/bold]
   add-expense [amount] [category] [--note NOTE]   Add an expense
   add-income  [amount] [category] [--note NOTE]   Add an income
-  summary [filters]                               Show summary by category and type
+  summary [filters] [--in CUR]                    Show summary by category and type
   list [filters]                                  List all records (with filters)
   graph [--type TYPE] [--category CAT] [--by BY]  Show bar graph by month or category
+  dashboard [--refresh S] [--months N] [--once]   Live budget use, monthly trend and category spend
+  forecast [--months N] [--category CAT]          Project this month's and the next months' spending
   set-budget --monthly AMOUNT                     Set monthly budget
   set-budget --category CAT --amount AMOUNT       Set category budget
   show-budgets                                    Show all budgets
   add-recurring [expense|income] AMOUNT CAT NOTE DAY  Add recurring transaction (day=1-31)
   show-recurring                                  List recurring transactions
-  delete [record_id]                              Delete a record by its number (see list)
-  edit [record_id] [field] [value]                Edit a record field by its number
-  search [keyword]                                Search records by keyword
+  delete [record_id]                              Delete a record by its ID (see list)
+  edit [record_id] [field] [value]                Edit a record field by its ID
+  show [record_id]                                Show a single record by its ID
+  search [terms] [--limit N]                      Search notes/categories (all terms; OR for either)
+  backend [csv|columnar|partitioned]              Show or switch (and migrate) the storage backend
+  export-csv PATH                                 Export the ledger as a records.csv file
+  compact                                         Fold pending edits/deletes into the ledger
+  archive [--before YYYY-MM] [--list]             Seal closed months into compressed archive segments
+  import PATH [--map FIELD=COL] [--date-format F] Import records from a CSV/JSONL/bank statement file
+  serve                                           Keep the ledger warm and answer CLI calls over a socket
+  convert-currency AMOUNT... SRC DST [--refresh]  Convert amounts using cached exchange rates
+  currency [CODE]                                 Show or set the currency the ledger is kept in
   shell                                           Enter interactive mode
+  batch [FILE] [--stop-on-error]                  Run commands from a file or stdin, one per line
   help                                            Show this help message
 
 [bold]Aliases:[/bold]
@@ -410,6 +3044,20 @@ def help_cmd():
   --to YYYY-MM-DD              Filter to date
   --min-amount AMOUNT          Minimum amount
   --max-amount AMOUNT          Maximum amount
+  --jobs N                     Worker processes for summary/graph on the csv backend
+                               (bypasses the NumPy cache; 1 = single process)
+
+[bold]List output:[/bold]
+  --sort FIELD [--desc]        Sort by id, datetime, amount, category or type
+  --page-size N                Print tables of N rows as the ledger is read
+  --page N                     Show only page N (50 rows unless --page-size)
+  --limit N                    Show at most N records
+  --plain                      Tab-separated output for scripts and pipes
+
+[bold]Profiling (before the command):[/bold]
+  --profile                    Print time per phase and rows/bytes read to stderr
+  --profile-out FILE.json      Also save the timings as a JSON trace
+  --cprofile FILE.prof         Also save cProfile stats for the whole run
 
 [bold]Examples:[/bold]
   tbudget add-expense 12.5 food --note "Lunch"
@@ -421,6 +3069,8 @@ def help_cmd():
   tbudget graph --type expense --category food
   tbudget graph --type expense --by category
   tbudget list --min-amount 10 --from 2024-01-01
+  tbudget list --sort amount --desc --limit 10
+  tbudget list --plain | cut -f4
   tbudget delete 3
   tbudget edit 2 note "Corrected note"
   tbudget search lunch
@@ -429,15 +3079,19 @@ def help_cmd():
     console.print(Panel(help_text, title="TBudget Help", style="green"))
 
 def show_recurring():
+    from rich import box
+    from rich.table import Table
     recurs = load_json(RECUR_FILE, [])
+    state = load_json(RECUR_STATE_FILE, {})
     table = Table(title="Recurring Transactions", box=box.ROUNDED)
     table.add_column("Type")
     table.add_column("Amount")
     table.add_column("Category")
     table.add_column("Note")
     table.add_column("Day")
+    table.add_column("Last Applied")
     for r in recurs:
-        table.add_row(r["type"], str(r["amount"]), r["category"], r["note"], str(r["day"]))
+        table.add_row(r["type"], amount_text(r["amount"]), r["category"], r["note"], str(r["day"]), state.get(recurring_key(r), "-"))
     console.print(table)
 
 class RichArgumentParser(ArgumentParser):
@@ -446,6 +3100,9 @@ class RichArgumentParser(ArgumentParser):
         sys.exit(2)
 
 def shell():
+    from rich.panel import Panel
+    from rich.prompt import Prompt
+    enable_ledger_cache()
     console.print(Panel("[bold cyan]Welcome to TBudget Shell![/bold cyan]\nType 'help' for commands, 'exit' to quit.\nType 'clear' to clear the screen.", style="blue"))
     while True:
         try:
@@ -467,109 +3124,624 @@ def shell():
         except Exception as e:
             console.print(f"[red]Shell error: {e}[/]")
 
+BATCH_WRITES = {"add-expense": "expense", "ae": "expense", "add-income": "income", "ai": "income"}
+BATCH_EXCLUDED = ("shell", "sh", "serve", "batch")
+# One plain, "double" or 'single' quoted word; anything fancier goes to shlex
+BATCH_TOKEN = re.compile(r"""\s*(?:"([^"\\]*)"|'([^']*)'|([^\s"'\\]+))(?=\s|$)""")
+
+# shlex.split(line), as `shell` splits what is typed, with a regex fast path
+# for the simple quoting scripts normally use. A line whose first non-blank
+# character is # is a comment; a # inside a word is just a character.
+def split_command(line):
+    if line.lstrip().startswith("#"):
+        return []
+    tokens, pos, end = [], 0, len(line.rstrip())
+    while pos < end:
+        m = BATCH_TOKEN.match(line, pos)
+        if not m:
+            return shlex.split(line)
+        plain, single, word = m.groups()
+        tokens.append(plain if plain is not None else single if single is not None else word)
+        pos = m.end()
+    return tokens
+
+# `add-expense AMOUNT CATEGORY [--note NOTE]` without going through argparse;
+# None for any other shape, which then gets the full parser (and its errors)
+def parse_batch_write(argv):
+    if argv[0] not in BATCH_WRITES or len(argv) not in (3, 5) or argv[2].startswith("-"):
+        return None
+    if len(argv) == 5 and (argv[3] != "--note" or argv[4].startswith("-")):
+        return None
+    try:
+        amount = money(argv[1])
+    except ValueError:
+        return None
+    return BATCH_WRITES[argv[0]], amount, argv[2], argv[4] if len(argv) == 5 else ""
+
+# Runs commands read from a file ("-" for stdin), one per line in shell
+# syntax; blank lines and lines starting with # are skipped. The parser is
+# built once, read commands share one in-memory ledger, and each run of
+# consecutive add-expense/add-income lines is written as one transaction: a
+# single append and fsync, then one budget check on the final totals.
+# Returns the number of lines that failed.
+def run_batch(path, stop_on_error=False):
+    global SCAN_JOBS
+    started = datetime.now()
+    parser = build_parser()
+    pending = []
+    ran = failed = 0
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line_no, line in enumerate(f, 1):
+            try:
+                argv = split_command(line)
+            except ValueError as e:
+                argv, error = None, str(e)
+            if argv == []:
+                continue
+            write = argv and parse_batch_write(argv)
+            if write:
+                ran += 1
+                pending.append((datetime.now(),) + write)
+                continue
+            try:
+                if argv is None:
+                    raise ValueError(error)
+                args = parser.parse_args(argv)
+                if args.cmd in BATCH_EXCLUDED:
+                    raise ValueError(f"{args.cmd} can't be used in a batch")
+            except (SystemExit, ValueError) as e:
+                if isinstance(e, ValueError):
+                    console.print(f"[bold red]Error:[/] {e}")
+                console.print(f"[red]Line {line_no} failed: {line.strip()}[/]")
+                failed += 1
+                if stop_on_error:
+                    break
+                continue
+            ran += 1
+            if args.cmd in BATCH_WRITES:
+                pending.append((datetime.now(), BATCH_WRITES[args.cmd], args.amount, args.category, args.note))
+                continue
+            flush_batch(pending)
+            pending = []
+            if _ledger_cache is None:
+                enable_ledger_cache()
+            SCAN_JOBS = getattr(args, "jobs", None)
+            try:
+                dispatch(args)
+            except SystemExit:
+                pass
+        flush_batch(pending)
+    except Exception as e:
+        console.print(f"[red]Batch stopped after {ran} commands: {e}[/]")
+        return failed + 1
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    elapsed = max((datetime.now() - started).total_seconds(), 1e-6)
+    color = "yellow" if failed else "green"
+    console.print(f"[{color}]Ran {ran} command{'s' * (ran != 1)} in {elapsed:.2f}s ({ran / elapsed:,.0f}/s), {failed} failed.[/]")
+    return failed
+
+def flush_batch(rows):
+    if len(rows) == 1:
+        _, rec_type, amount, category, note = rows[0]
+        alerts = append_records(rows)
+        emoji = "💸" if rec_type == "expense" else "💰"
+        console.print(f"{emoji} Logged {format_minor(amount)} as [bold]{rec_type}[/] in [bold]{category}[/]")
+        for alert in alerts:
+            console.print(alert)
+    elif rows:
+        append_records(rows, alerts=False)
+        affected = {}
+        for dt, rec_type, _, category, _ in rows:
+            if rec_type == "expense":
+                affected.setdefault(get_month(dt), set()).add(category)
+        expenses = sum(amount for _, rec_type, amount, _, _ in rows if rec_type == "expense")
+        incomes = sum(amount for _, rec_type, amount, _, _ in rows if rec_type == "income")
+        console.print(f"💸 Logged {len(rows)} records: {format_minor(expenses)} expenses, {format_minor(incomes)} income")
+        for alert in import_budget_alerts(load_aggregates(), load_json(BUDGET_FILE, {}), affected):
+            console.print(alert)
+
+# Runs one command with its output captured instead of printed, for the daemon
+def run_captured(argv, width=None, color_system=None):
+    global console
+    saved = console
+    buf = io.StringIO()
+    console = Console(file=buf, width=width or 80, force_terminal=color_system is not None,
+                      color_system=color_system)
+    code = 0
+    try:
+        with contextlib.redirect_stdout(buf):
+            main(argv, shell_mode=True)
+    except SystemExit as e:
+        # The exit status the command would have had when run directly
+        code = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/]")
+        code = 1
+    finally:
+        console = saved
+    return buf.getvalue(), code
+
+# Daemon mode: keeps the ledger, aggregates and indexes warm in one process and
+# runs SERVE_COMMANDS for clients on a Unix socket in data/. Requests are
+# handled one at a time, so writes from concurrent scripts never interleave.
+def serve():
+    import socketserver
+    if not hasattr(socketserver, "UnixStreamServer"):
+        console.print("[red]serve needs Unix domain sockets, which this platform doesn't have.[/]")
+        return
+    if daemon_running():
+        console.print(f"[yellow]A daemon is already serving {SERVE_SOCKET}.[/]")
+        return
+    if os.path.exists(SERVE_SOCKET):
+        os.remove(SERVE_SOCKET)  # left behind by a daemon that didn't shut down cleanly
+    ensure_data_dir()
+    process_recurring()
+    enable_ledger_cache()
+    ledger_cache()
+    load_aggregates()
+
+    class Handler(socketserver.StreamRequestHandler):
+        # Requests are served one at a time, so a client that connects and
+        # goes quiet is dropped instead of stalling everyone else
+        timeout = SERVE_TIMEOUT
+
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+            except (OSError, ValueError):
+                return
+            output, code = run_captured(request["argv"], request.get("width"), request.get("color_system"))
+            self.wfile.write(json.dumps({"output": output, "exit": code}).encode("utf-8"))
+
+    server = socketserver.UnixStreamServer(SERVE_SOCKET, Handler)
+    # `kill` stops the daemon as cleanly as Ctrl-C does
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    console.print(f"[green]Serving the ledger on {SERVE_SOCKET} (Ctrl-C to stop)[/]")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(SERVE_SOCKET):
+            os.remove(SERVE_SOCKET)
+        console.print("[cyan]Daemon stopped.[/]")
+
+def connect_daemon():
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SERVE_SOCKET)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def daemon_running():
+    if not os.path.exists(SERVE_SOCKET):
+        return False
+    try:
+        connect_daemon().close()
+        return True
+    except OSError:
+        return False
+
+# Thin client: hands the command to a running daemon, prints its output and
+# returns the command's exit status. Returns None (run the command locally)
+# when no daemon is listening. Once connected it never falls back, so a write
+# can't be applied twice.
+def forward_to_daemon(argv):
+    if not argv or argv[0] not in SERVE_COMMANDS or os.environ.get("TBUDGET_NO_DAEMON"):
+        return None
+    # A profiled run has to happen in this process to time it
+    if os.environ.get("TBUDGET_PROFILE"):
+        return None
+    if not os.path.exists(SERVE_SOCKET):
+        return None
+    try:
+        sock = connect_daemon()
+    except (OSError, AttributeError):
+        return None
+    request = {"argv": argv, "width": console.width, "color_system": console.color_system}
+    chunks = []
+    with sock:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    try:
+        response = json.loads(b"".join(chunks))
+    except ValueError:
+        console.print("[red]The daemon closed the connection without answering.[/]")
+        return 1
+    sys.stdout.write(response["output"])
+    sys.stdout.flush()
+    return response["exit"]
+
+# Rate tables are cached per base currency in RATES_FILE. A table younger than
+# the TTL is used as is; an older one (up to the max age) is still served while
+# a fresh copy is fetched in the background. Any table that lists both
+# currencies gives the cross rate, so one download covers every pair.
+def rates_settings():
+    config = load_config()
+    source = os.environ.get("TBUDGET_RATES_URL") or config.get("rates_url") or RATES_URL
+    ttl = float(config.get("rates_ttl", RATES_TTL))
+    max_age = float(config.get("rates_max_age", RATES_MAX_AGE))
+    return source, ttl, max_age
+
+# Downloads the rate table for `base` and stores it in the cache. The source is
+# a URL or a local JSON file (open.er-api.com format); "{base}" is filled in.
+def fetch_rates(base):
+    import requests
+    source = rates_settings()[0].format(base=base)
+    if source.startswith("file:"):
+        source = source[len("file:"):]
+    # Anything without a scheme (http://...) is a local file
+    if re.match(r"[A-Za-z][A-Za-z0-9+.-]*://", source):
+        with phase("network"):
+            data = requests.get(source, timeout=5).json()
+    else:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"rates file not found: {source}")
+        with open(source) as f:
+            data = json.load(f)
+    if not data.get("rates"):
+        raise ValueError(data.get("error-type") or "no rates in response")
+    base = (data.get("base_code") or base).upper()
+    rates = {code.upper(): float(rate) for code, rate in data["rates"].items()}
+    rates[base] = 1.0
+    table = {"base": base, "fetched": datetime.now().timestamp(), "rates": rates}
+    cache = load_json(RATES_FILE, {})
+    cache[base] = table
+    os.makedirs(os.path.dirname(RATES_FILE), exist_ok=True)
+    save_json(RATES_FILE, cache, sync=False)
+    return table
+
+# Best cached table for a pair: the src-based one, otherwise the freshest one
+# that knows both currencies
+def cached_rate_table(src, dst):
+    cache = load_json(RATES_FILE, {})
+    own = cache.get(src)
+    if own and dst in own["rates"]:
+        return own
+    tables = [t for t in cache.values() if src in t["rates"] and dst in t["rates"]]
+    return max(tables, key=lambda t: t["fetched"], default=None)
+
+_rates_refreshing = set()
+
+def refresh_rates_later(base):
+    if base in _rates_refreshing:
+        return
+    _rates_refreshing.add(base)
+
+    def run():
+        try:
+            fetch_rates(base)
+        except Exception:
+            pass  # keep serving the stale table; the next call retries
+    # Not a daemon thread, so a one-shot command still finishes the refresh
+    threading.Thread(target=run).start()
+
+def rate_table(src, dst, refresh=False):
+    _, ttl, max_age = rates_settings()
+    cached = None if refresh else cached_rate_table(src, dst)
+    if cached:
+        age = datetime.now().timestamp() - cached["fetched"]
+        if age < ttl:
+            return cached
+        if age < max_age:
+            refresh_rates_later(cached["base"])
+            return cached
+    try:
+        return fetch_rates(src)
+    except Exception as e:
+        cached = cached or cached_rate_table(src, dst)
+        if not cached:
+            raise
+        fetched = datetime.fromtimestamp(cached["fetched"]).strftime("%Y-%m-%d %H:%M")
+        console.print(f"[yellow]Could not refresh exchange rates ({e}); using rates from {fetched}.[/]")
+        return cached
+
+# Multiplier that turns an amount in src into dst (None if a currency is unknown)
+def exchange_rate(src, dst, refresh=False):
+    src, dst = src.upper(), dst.upper()
+    if src == dst:
+        return 1.0
+    rates = rate_table(src, dst, refresh)["rates"]
+    if src not in rates or dst not in rates:
+        return None
+    return rates[dst] / rates[src]
+
+def home_currency():
+    return load_config().get("currency", DEFAULT_CURRENCY).upper()
+
 def convert_currency(amount, src, dst):
-    # Convert amount from src currency to dst currency using open.er-api.com
+    # Convert amount from src currency to dst currency using the cached rate tables
     try:
-        data = requests.get(f"https://open.er-api.com/v6/latest/{src.upper()}", timeout=5).json()
-        rate = data["rates"].get(dst.upper())
+        rate = exchange_rate(src, dst)
         return rate * amount if rate else None
     except Exception as e:
         console.print(f"[red]Currency conversion error: {e}[/]")
         return None
 
-def currency_command(amount, src, dst):
-    result = convert_currency(amount, src, dst)
-    if result is not None:
-        console.print(f"[green]{amount} {src.upper()} = {result:.2f} {dst.upper()}[/]")
-    else:
+def currency_command(amounts, src, dst, refresh=False):
+    # All amounts share one rate lookup
+    try:
+        rate = exchange_rate(src, dst, refresh)
+    except Exception as e:
+        console.print(f"[red]Currency conversion error: {e}[/]")
+        rate = None
+    if rate is None:
         console.print(f"[red]Conversion failed from {src.upper()} to {dst.upper()}.[/]")
+        return
+    for amount in amounts:
+        console.print(f"[green]{amount} {src.upper()} = {amount * rate:.2f} {dst.upper()}[/]")
 
-def get_all_data_for_ai():
-    # Gather all user data for the AI assistant prompt, but do NOT display in terminal
-    ensure_csv()
-    ensure_data_dir()
-    records = []
-    try:
-        with open(CSV_FILE) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                records.append(row)
-    except Exception:
-        pass
+# Shows or sets the currency ledger amounts are recorded in
+@write_lock()
+def currency_setting_command(code):
+    if not code:
+        console.print(f"[cyan]Ledger currency: {home_currency()}[/]")
+        return
+    global _money_digits
+    old_digits, new_digits = money_digits(), currency_digits(code)
+    config = load_config()
+    config["currency"] = code.upper()
+    save_config(config)
+    _money_digits = new_digits
+    if new_digits != old_digits:
+        # Stored amounts keep their own scale (only the partition manifest's
+        # totals are recomputed); derived indexes notice the change and
+        # rebuild themselves
+        get_store().rescale(old_digits, new_digits)
+    console.print(f"[green]Ledger currency set to {code.upper()}.[/]")
+
+# Single pass over the ledger for the parts of the AI context that the
+# aggregate index doesn't already hold: top notes by spend and the most recent
+# records. Cached in AI_CONTEXT_FILE until the ledger changes.
+def ledger_digest():
+    signature = ledger_signature()
+    cached = load_json(AI_CONTEXT_FILE, None)
+    if isinstance(cached, dict) and cached.get("signature") == signature and cached.get("digits") == money_digits():
+        return cached
+    count, first, last = 0, None, None
+    notes = {}
+    recent = []
+    for rid, row in iter_records():
+        try:
+            amount = decode_row(row).amount
+        except ROW_ERRORS:
+            note_malformed("summarizing the ledger for the assistant", [rid])
+            continue
+        count += 1
+        dt = row["datetime"]
+        first = dt if first is None or dt < first else first
+        last = dt if last is None or dt > last else last
+        note = row["note"].strip()
+        if note and row["type"] == "expense":
+            entry = notes.setdefault(note.lower(), [note, 0, 0])
+            entry[1] += 1
+            entry[2] += amount
+        item = (dt, rid, row["type"], amount, row["category"], note)
+        if len(recent) < AI_RECENT:
+            heapq.heappush(recent, item)
+        else:
+            heapq.heappushpop(recent, item)
+    digest = {
+        "signature": signature,
+        "digits": money_digits(),
+        "records": count,
+        "first": first,
+        "last": last,
+        "notes": heapq.nlargest(AI_TOP_NOTES, notes.values(), key=lambda n: n[2]),
+        "recent": sorted(recent, reverse=True),
+    }
+    os.makedirs(os.path.dirname(AI_CONTEXT_FILE), exist_ok=True)
+    save_json(AI_CONTEXT_FILE, digest, sync=False)
+    return digest
+
+# Rough token count (about 4 characters per token for English/JSON text)
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+# Compact text summary of the user's finances for the assistant's system
+# prompt. Sections are added in priority order, and lines are dropped once the
+# token budget is spent, so the prompt stays the same size however big the ledger gets.
+def build_ai_context(token_budget=AI_CONTEXT_TOKENS):
+    agg = load_aggregates()
+    digest = ledger_digest()
     budgets = load_json(BUDGET_FILE, {})
     recurring = load_json(RECUR_FILE, [])
-    summary = {}
-    for row in records:
-        key = f"{row['type']}::{row['category']}"
-        summary[key] = summary.get(key, 0) + float(row["amount"])
-    return {
-        "records": records,
-        "budgets": budgets,
-        "recurring": recurring,
-        "summary": summary,
-    }
+    currency = home_currency()
+    month = get_month(datetime.now())
 
-def ai_assistant_command(user_message, model="qwen/qwen3-32b", temperature=0.7, max_completion_tokens=512, show_think=False):
-    # Sends a prompt to ai.hackclub.com with all user data included in the system prompt
-    ai_data = get_all_data_for_ai()
-    system_prompt = (
-        "You are a financial assistant. The following is the user's complete financial data:\n"
-        f"Records: {json.dumps(ai_data['records'], ensure_ascii=False)}\n"
-        f"Budgets: {json.dumps(ai_data['budgets'], ensure_ascii=False)}\n"
-        f"Recurring: {json.dumps(ai_data['recurring'], ensure_ascii=False)}\n"
-        f"Summary: {json.dumps(ai_data['summary'], ensure_ascii=False)}\n"
-        "Respond to the user's request using this data. Do not reveal the raw data unless asked."
-    )
-    payload = {
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        "model": model,
-        "temperature": temperature,
-        "max_completion_tokens": max_completion_tokens
-    }
+    totals = {}
+    categories = {}
+    for types in agg["months"].values():
+        for typ, amount in types.items():
+            totals[typ] = totals.get(typ, 0) + amount
+    for types in agg["categories"].values():
+        for cat, amount in types.get("expense", {}).items():
+            categories[cat] = categories.get(cat, 0) + amount
+    income, expense = totals.get("income", 0), totals.get("expense", 0)
+
+    sections = []
+    sections.append(("Overview", [
+        f"currency: {currency}; today: {date.today().isoformat()}",
+        f"records: {digest['records']} from {(digest['first'] or '-')[:10]} to {(digest['last'] or '-')[:10]}",
+        f"all time: income {format_minor(income)}, expense {format_minor(expense)}, net {format_minor(income - expense)}",
+    ]))
+    month_cats = agg["categories"].get(month, {}).get("expense", {})
+    lines = []
+    limits = [("monthly", agg["months"].get(month, {}).get("expense", 0), budgets["monthly"])] if "monthly" in budgets else []
+    limits += [(cat, month_cats.get(cat, 0), limit) for cat, limit in sorted(budgets.get("categories", {}).items())]
+    for name, spent, limit in limits:
+        limit = to_minor(limit)
+        # A zero budget has no share to show
+        share = f" ({spent / limit:.0%})" if limit > 0 else ""
+        lines.append(f"{name}: {format_minor(spent)} of {format_minor(limit)}{share}")
+    sections.append((f"Budgets for {month}", lines))
+    sections.append((f"Expense by category in {month}", [
+        f"{cat}: {format_minor(amount)}" for cat, amount in sorted(month_cats.items(), key=lambda c: -c[1])
+    ]))
+    sections.append(("Monthly totals (newest first)", [
+        f"{m}: " + ", ".join(f"{typ} {format_minor(amount)}" for typ, amount in sorted(types.items()))
+        for m, types in sorted(agg["months"].items(), reverse=True)
+    ]))
+    sections.append(("Expense by category (all time)", [
+        f"{cat}: {format_minor(amount)}" for cat, amount in sorted(categories.items(), key=lambda c: -c[1])
+    ]))
+    sections.append(("Recurring", [
+        f"{r['type']} {r['amount']} {r['category']} on day {r['day']}" + (f" ({r['note']})" if r.get("note") else "")
+        for r in recurring
+    ]))
+    sections.append(("Top expense notes (total, count)", [
+        f"{note}: {format_minor(total)} ({count}x)" for note, count, total in digest["notes"]
+    ]))
+    sections.append(("Most recent records", [
+        f"#{rid} {dt[:16]} {typ} {format_minor(amount)} {cat}" + (f" {note}" if note else "")
+        for dt, rid, typ, amount, cat, note in digest["recent"]
+    ]))
+
+    out = []
+    used = 0
+    for title, lines in sections:
+        if not lines:
+            continue
+        header = f"## {title}"
+        if used + estimate_tokens(header) > token_budget:
+            break
+        out.append(header)
+        used += estimate_tokens(header)
+        for i, line in enumerate(lines):
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                out.append(f"... ({len(lines) - i} more not shown)")
+                used += cost
+                break
+            out.append(line)
+            used += cost
+    return "\n".join(out)
+
+def ai_assistant_command(user_message, model="qwen/qwen3-32b", temperature=0.7, max_completion_tokens=512, show_think=False,
+                         context_tokens=None, show_context=False):
+    import requests
+    from rich.panel import Panel
+    # Sends a prompt to the chat completions endpoint with a summary of the user's data in the system prompt
+    config = load_config()
+    if context_tokens is None:
+        context_tokens = int(config.get("ai_context_tokens", AI_CONTEXT_TOKENS))
+    url = os.environ.get("TBUDGET_AI_URL") or config.get("ai_url") or AI_URL
     try:
-        resp = requests.post(
-            "https://ai.hackclub.com/chat/completions",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload),
-            timeout=30
+        context = build_ai_context(context_tokens)
+        if show_context:
+            console.print(Panel(context, title=f"AI Context (~{estimate_tokens(context)} tokens)", style="magenta"))
+            return
+        system_prompt = (
+            "You are a financial assistant. The following is a summary of the user's financial data:\n"
+            f"{context}\n"
+            "Respond to the user's request using this data. Do not reveal the raw data unless asked."
         )
-        data = resp.json()
+        payload = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ],
+            "model": model,
+            "temperature": temperature,
+            "max_completion_tokens": max_completion_tokens
+        }
+        with phase("network"):
+            resp = requests.post(
+                url,
+                headers={"Content-Type": "application/json"},
+                data=json.dumps(payload),
+                timeout=30
+            )
+            data = resp.json()
         content = data["choices"][0]["message"]["content"]
         if not show_think:
-            import re
             content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL)
         console.print(Panel(content.strip(), title="AI Assistant", style="magenta"))
     except Exception as e:
         console.print(f"[red]AI assistant error: {e}[/]")
 
+@write_lock()
+def backend_command(target=None):
+    current = get_store()
+    if target is None:
+        console.print(f"[cyan]Current backend: [bold]{current.name}[/bold] (available: {', '.join(STORES)})[/]")
+        return
+    if target == current.name:
+        console.print(f"[yellow]Already using the {target} backend.[/]")
+        return
+    # Copy the ledger (journal applied) into the new backend before switching
+    # the config over
+    skipped = get_store(target).rewrite(row for _, row in iter_records(archived=False)) or 0
+    fold_journal_into_archive(*load_journal())
+    config = load_config()
+    config["backend"] = target
+    save_config(config)
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    rebuild_aggregates()
+    console.print(f"[green]Switched backend from {current.name} to [bold]{target}[/bold].[/]")
+    if skipped:
+        console.print(f"[yellow]{skipped} malformed rows could not be converted and were left out.[/]")
+
+# Write the active ledger out in the records.csv format
+def export_csv(path):
+    rows = list(ledger_rows())
+    CsvStore(path).rewrite(rows)
+    console.print(f"[green]Exported {len(rows)} records to {path}[/]")
+
+@write_lock()
 def reset_data():
     # Delete all user data files in the data directory
-    files = [CSV_FILE, BUDGET_FILE, RECUR_FILE]
+    files = [CSV_FILE, BUDGET_FILE, RECUR_FILE, AGG_FILE, CONFIG_FILE, JOURNAL_FILE, ID_INDEX_FILE, ID_INDEX_META, COLUMNAR_DIR, PARTITION_DIR, ARCHIVE_DIR, PENDING_DIR, os.path.join(DATA_DIR, "cache")]
     for f in files:
         try:
-            if os.path.exists(f):
+            if os.path.isdir(f):
+                shutil.rmtree(f)
+            elif os.path.exists(f):
                 os.remove(f)
         except Exception as e:
             console.print(f"[red]Error deleting {f}: {e}[/]")
+    for f in glob.glob(SEARCH_INDEX + "*"):
+        os.remove(f)
     console.print("[bold red]All user data has been reset![/]")
 
-def main(argv=None, shell_mode=False):
-    process_recurring()
+# Commands that only append a record. They get a parser with just their own
+# subcommands, which keeps scripted `add-expense` calls fast to start.
+FAST_COMMANDS = ("add-expense", "ae", "add-income", "ai")
+_parsers = {}
+
+def build_parser(full=True):
+    if full in _parsers:
+        return _parsers[full]
     p = RichArgumentParser(prog="TBudget", add_help=False)
+    p.add_argument("--profile", action="store_true", help="Print per-phase timings to stderr (or set TBUDGET_PROFILE=1)")
+    p.add_argument("--profile-out", metavar="FILE", help="Also write the timings as a JSON trace")
+    p.add_argument("--cprofile", metavar="FILE", help="Also dump cProfile stats (open with pstats or snakeviz)")
     sub = p.add_subparsers(dest="cmd")
 
     # Add-expense/income
     a1 = sub.add_parser("add-expense", aliases=["ae"])
-    a1.add_argument("amount", type=float)
+    a1.add_argument("amount", type=money)
     a1.add_argument("category")
     a1.add_argument("--note", default="")
     a2 = sub.add_parser("add-income", aliases=["ai"])
-    a2.add_argument("amount", type=float)
+    a2.add_argument("amount", type=money)
     a2.add_argument("category")
     a2.add_argument("--note", default="")
+    if not full:
+        _parsers[full] = p
+        return p
 
     # Summary
     s = sub.add_parser("summary", aliases=["sum"])
@@ -577,6 +3749,8 @@ def main(argv=None, shell_mode=False):
     s.add_argument("--category", help="Filter by category")
     s.add_argument("--from", dest="date_from", help="Filter from date (YYYY-MM-DD)")
     s.add_argument("--to", dest="date_to", help="Filter to date (YYYY-MM-DD)")
+    s.add_argument("--in", dest="currency", help="Show totals converted to this currency")
+    s.add_argument("--jobs", type=int, help="Worker processes for scanning records.csv on the csv backend; bypasses the NumPy cache (default: automatic)")
 
     # List
     l = sub.add_parser("list", aliases=["ls"])
@@ -584,26 +3758,49 @@ def main(argv=None, shell_mode=False):
     l.add_argument("--category", help="Filter by category")
     l.add_argument("--from", dest="date_from", help="Filter from date (YYYY-MM-DD)")
     l.add_argument("--to", dest="date_to", help="Filter to date (YYYY-MM-DD)")
-    l.add_argument("--min-amount", type=float, help="Show only records with amount >= this value")
-    l.add_argument("--max-amount", type=float, help="Show only records with amount <= this value")
+    l.add_argument("--min-amount", type=money, help="Show only records with amount >= this value")
+    l.add_argument("--max-amount", type=money, help="Show only records with amount <= this value")
+    l.add_argument("--sort", choices=LIST_SORT_KEYS, help="Sort by a field (default: ledger order)")
+    l.add_argument("--desc", action="store_true", help="Sort in descending order")
+    l.add_argument("--page-size", type=int, help="Print results in tables of N rows as they are read")
+    l.add_argument("--page", type=int, help=f"Show only page N (default page size {LIST_PAGE_SIZE})")
+    l.add_argument("--limit", type=int, help="Show at most N records")
+    l.add_argument("--plain", action="store_true", help="Write tab-separated rows to stdout without formatting")
 
     # Graph
     g = sub.add_parser("graph", aliases=["gr"])
     g.add_argument("--type", choices=["expense", "income"], help="Filter by record type")
     g.add_argument("--category", help="Filter by category")
     g.add_argument("--by", choices=["month", "category"], default="month", help="Graph by month or by category")
+    g.add_argument("--jobs", type=int, help="Worker processes for scanning records.csv on the csv backend; bypasses the NumPy cache (default: automatic)")
+
+    # Dashboard
+    db = sub.add_parser("dashboard", aliases=["dash"])
+    db.add_argument("--months", type=int, default=DASHBOARD_MONTHS, help="Months shown in the trend table")
+    db.add_argument("--refresh", type=float, default=DASHBOARD_REFRESH, help="Seconds between refreshes")
+    db.add_argument("--once", action="store_true", help="Print one frame and exit")
+
+    # Forecast
+    fc = sub.add_parser("forecast", aliases=["fc"])
+    fc.add_argument("--months", type=int, default=FORECAST_MONTHS, help="Months to project after the current one")
+    fc.add_argument("--category", help="Only show this category")
+
+    # Archive
+    av = sub.add_parser("archive")
+    av.add_argument("--before", metavar="YYYY-MM", help="Archive months before this one (default: the current month)")
+    av.add_argument("--list", action="store_true", help="Show the archived months instead")
 
     # Set budget
     sb = sub.add_parser("set-budget", aliases=["sb"])
-    sb.add_argument("--monthly", type=float, help="Set monthly budget")
+    sb.add_argument("--monthly", type=money, help="Set monthly budget")
     sb.add_argument("--category", help="Set category budget")
-    sb.add_argument("--amount", type=float, help="Budget amount for category")
+    sb.add_argument("--amount", type=money, help="Budget amount for category")
     sub.add_parser("show-budgets", aliases=["budgets"])
 
     # Recurring
     ar = sub.add_parser("add-recurring", aliases=["ar"])
     ar.add_argument("type", choices=["expense", "income"])
-    ar.add_argument("amount", type=float)
+    ar.add_argument("amount", type=money)
     ar.add_argument("category")
     ar.add_argument("note")
     ar.add_argument("day", type=int, help="Day of month (1-31)")
@@ -611,34 +3808,205 @@ def main(argv=None, shell_mode=False):
 
     # Shell/help
     sub.add_parser("shell", aliases=["sh"])
+    bt = sub.add_parser("batch")
+    bt.add_argument("file", nargs="?", default="-", help="File with one command per line (default: stdin)")
+    bt.add_argument("--stop-on-error", action="store_true", help="Stop at the first line that fails")
     sub.add_parser("help", aliases=["h", "?"])
 
     # Delete/edit/search/aliases
     sub.add_parser("delete", aliases=["del", "rm"]).add_argument("record_id", type=int)
+    sub.add_parser("show", aliases=["get"]).add_argument("record_id", type=int)
     e = sub.add_parser("edit", aliases=["ed", "mod"])
     e.add_argument("record_id", type=int)
     e.add_argument("field")
     e.add_argument("value")
-    sub.add_parser("search", aliases=["find", "f"]).add_argument("keyword")
+    se = sub.add_parser("search", aliases=["find", "f"])
+    se.add_argument("keyword", nargs="+", help="Terms to match; use OR between alternatives")
+    se.add_argument("--limit", type=int, default=SEARCH_LIMIT, help="Maximum number of results to show")
 
     # Currency conversion
     cc = sub.add_parser("convert-currency", aliases=["cc"])
-    cc.add_argument("amount", type=float)
+    cc.add_argument("amount", type=float, nargs="+", help="One or more amounts to convert")
     cc.add_argument("src")
     cc.add_argument("dst")
+    cc.add_argument("--refresh", action="store_true", help="Fetch fresh rates instead of using the cache")
+
+    # Ledger currency
+    cu = sub.add_parser("currency")
+    cu.add_argument("code", nargs="?", help="Currency code ledger amounts are recorded in (e.g. USD)")
 
     # AI assistant
     ai_parser = sub.add_parser("ai-assistant", aliases=["ask"])
     ai_parser.add_argument("message", nargs="+", help="Ask the AI assistant a question")
     ai_parser.add_argument("--show-think", action="store_true", help="Show AI's <think>...</think> reasoning if present")
+    ai_parser.add_argument("--context-tokens", type=int, help=f"Token budget for the data summary sent with the question (default {AI_CONTEXT_TOKENS})")
+    ai_parser.add_argument("--show-context", action="store_true", help="Print the data summary instead of asking the assistant")
 
     # Data reset
     sub.add_parser("reset-data", aliases=["reset", "clear-data"])
 
+    # Storage backend
+    be = sub.add_parser("backend")
+    be.add_argument("name", nargs="?", choices=list(STORES), help="Backend to migrate the ledger to")
+    sub.add_parser("export-csv").add_argument("path", help="Destination CSV file")
+    sub.add_parser("compact")
+    sub.add_parser("serve")
+
+    # Bulk import
+    im = sub.add_parser("import")
+    im.add_argument("path", help="CSV or JSONL file to import")
+    im.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from the file extension)")
+    im.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                    help="Source column for a field (datetime, type, amount, category, note, debit, credit)")
+    im.add_argument("--date-format", help="strptime format for dates that aren't ISO (e.g. %%d/%%m/%%Y)")
+    im.add_argument("--category", default="uncategorized", help="Category for rows without one")
+    im.add_argument("--delimiter", default=",", help="CSV delimiter (default ',')")
+    _parsers[full] = p
+    return p
+
+# Opt-in timing for one command (--profile or TBUDGET_PROFILE). Time is
+# charged to named phases exclusively: while a nested phase runs (rows being
+# loaded inside a filter inside a render, say) the outer one is paused.
+# Nothing is created or timed when profiling is off; instrumented code checks
+# PROFILE or goes through phase(), which then returns a shared no-op context.
+class Profiler:
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+        self.events = []
+
+    def charge(self, name, seconds):
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+
+    def enter(self, name):
+        now = perf_counter()
+        if self.stack:
+            self.charge(self.stack[-1][0], now - self.stack[-1][1])
+        self.stack.append([name, now])
+        return now
+
+    def exit(self):
+        now = perf_counter()
+        name, resumed = self.stack.pop()
+        self.charge(name, now - resumed)
+        if self.stack:
+            self.stack[-1][1] = now
+        return now
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.phases.setdefault(name, [0.0, 0])[1] += 1
+        began = self.enter(name)
+        try:
+            yield
+        finally:
+            ended = self.exit()
+            self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+                                "ts": round((began - self.started) * 1e6), "dur": round((ended - began) * 1e6)})
+
+    # Wraps a row stream so the time spent producing each item goes to `name`
+    # and the number of items to `counter`
+    def iterate(self, name, iterable, counter):
+        it = iter(iterable)
+        count = 0
+        self.phases.setdefault(name, [0.0, 0])[1] += 1
+        try:
+            while True:
+                self.enter(name)
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    self.exit()
+                count += 1
+                yield item
+        finally:
+            self.count(counter, count)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def trace(self, argv):
+        total = perf_counter() - self.started
+        phases = {name: {"ms": round(seconds * 1000, 3), "calls": calls}
+                  for name, (seconds, calls) in self.phases.items()}
+        other = total - sum(seconds for seconds, _ in self.phases.values())
+        phases["other"] = {"ms": round(other * 1000, 3), "calls": 0}
+        # Chrome trace-event format (traceEvents) so it opens in chrome://tracing or Perfetto
+        return {"command": argv, "total_ms": round(total * 1000, 3), "phases": phases,
+                "counters": self.counters, "traceEvents": self.events}
+
+    def report(self, command):
+        from rich import box
+        from rich.table import Table
+        trace = self.trace(command)
+        table = Table(title=f"Profile: {command} ({trace['total_ms']:.1f} ms)", box=box.SIMPLE_HEAVY)
+        table.add_column("Phase")
+        table.add_column("ms", justify="right")
+        table.add_column("%", justify="right")
+        table.add_column("Calls", justify="right")
+        for name, info in sorted(trace["phases"].items(), key=lambda p: -p[1]["ms"]):
+            share = info["ms"] / trace["total_ms"] * 100 if trace["total_ms"] else 0
+            table.add_row(name, f"{info['ms']:.1f}", f"{share:.0f}", str(info["calls"] or ""))
+        for name, value in sorted(trace["counters"].items()):
+            table.add_row(f"[dim]{name}[/]", f"[dim]{value:,}[/]", "", "")
+        Console(stderr=True).print(table)
+
+PROFILE = None
+_no_phase = contextlib.nullcontext()
+
+def phase(name):
+    return PROFILE.phase(name) if PROFILE else _no_phase
+
+# Runs a command with profiling on: phase timings go to stderr, and optionally
+# a JSON trace (--profile-out / TBUDGET_PROFILE_OUT) and a cProfile dump
+# (--cprofile / TBUDGET_CPROFILE) are written.
+def run_profiled(args, argv, shell_mode=False):
+    global PROFILE
+    PROFILE = Profiler()
+    out = args.profile_out or os.environ.get("TBUDGET_PROFILE_OUT")
+    dump = args.cprofile or os.environ.get("TBUDGET_CPROFILE")
+    try:
+        if dump:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.runcall(run_command, args, shell_mode)
+            profiler.dump_stats(dump)
+        else:
+            run_command(args, shell_mode)
+    finally:
+        profile, PROFILE = PROFILE, None
+        profile.report(args.cmd)
+        if out:
+            with open(out, "w") as f:
+                json.dump(profile.trace(argv), f, indent=2)
+
+def run_command(args, shell_mode=False):
+    global _money_digits
+    _money_digits = None
+    with phase("recurring"):
+        process_recurring()
+    try:
+        dispatch(args, shell_mode)
+    finally:
+        report_malformed()
+
+def main(argv=None, shell_mode=False):
     if argv is None:
         argv = sys.argv[1:]
-    args = p.parse_args(argv)
+    args = build_parser(full=not (argv and argv[0] in FAST_COMMANDS)).parse_args(argv)
+    global SCAN_JOBS
+    SCAN_JOBS = getattr(args, "jobs", None)
+    if args.profile or args.profile_out or args.cprofile or os.environ.get("TBUDGET_PROFILE"):
+        run_profiled(args, argv, shell_mode)
+    else:
+        run_command(args, shell_mode)
 
+def dispatch(args, shell_mode=False):
     if args.cmd in ("add-expense", "ae"):
         add_record("expense", args.amount, args.category, args.note)
     elif args.cmd in ("add-income", "ai"):
@@ -651,6 +4019,7 @@ def main(argv=None, shell_mode=False):
             filter_category=args.category,
             date_from=date_from,
             date_to=date_to,
+            currency=args.currency,
         )
     elif args.cmd in ("list", "ls"):
         date_from = datetime.fromisoformat(args.date_from) if args.date_from else None
@@ -662,7 +4031,17 @@ def main(argv=None, shell_mode=False):
             date_to=date_to,
             min_amount=args.min_amount,
             max_amount=args.max_amount,
+            sort=args.sort,
+            descending=args.desc,
+            page=args.page,
+            page_size=args.page_size,
+            limit=args.limit,
+            plain=args.plain,
         )
+    elif args.cmd in ("dashboard", "dash"):
+        dashboard(args.months, args.refresh, args.once)
+    elif args.cmd in ("forecast", "fc"):
+        forecast(args.months, args.category)
     elif args.cmd in ("graph", "gr"):
         graph(
             filter_type=args.type,
@@ -684,23 +4063,52 @@ def main(argv=None, shell_mode=False):
         show_recurring()
     elif args.cmd in ("shell", "sh"):
         shell()
+    elif args.cmd == "archive":
+        archive_command(args.before, args.list)
+    elif args.cmd == "batch":
+        if run_batch(args.file, args.stop_on_error):
+            sys.exit(1)
     elif args.cmd in ("help", "h", "?") or args.cmd is None:
         help_cmd()
     elif args.cmd in ("delete", "del", "rm"):
         delete_record(args.record_id)
+    elif args.cmd in ("show", "get"):
+        show_record(args.record_id)
     elif args.cmd in ("edit", "ed", "mod"):
         edit_record(args.record_id, args.field, args.value)
     elif args.cmd in ("search", "find", "f"):
-        search_records(args.keyword)
+        search_records(" ".join(args.keyword), args.limit)
     elif args.cmd in ("convert-currency", "cc"):
-        currency_command(args.amount, args.src, args.dst)
-    elif args.cmd in ("ai-assistant", "ai"):
+        currency_command(args.amount, args.src, args.dst, args.refresh)
+    elif args.cmd == "currency":
+        currency_setting_command(args.code)
+    elif args.cmd in ("ai-assistant", "ask", "ai"):
         user_message = " ".join(args.message)
-        ai_assistant_command(user_message, show_think=getattr(args, "show_think", False))
+        ai_assistant_command(
+            user_message,
+            show_think=getattr(args, "show_think", False),
+            context_tokens=args.context_tokens,
+            show_context=args.show_context,
+        )
     elif args.cmd in ("reset-data", "reset", "clear-data"):
         reset_data()
+    elif args.cmd == "backend":
+        backend_command(args.name)
+    elif args.cmd == "export-csv":
+        export_csv(args.path)
+    elif args.cmd == "compact":
+        compact_ledger()
+    elif args.cmd == "serve":
+        serve()
+    elif args.cmd == "import":
+        mapping = dict(m.split("=", 1) for m in args.map if "=" in m)
+        import_records(args.path, args.format, mapping, args.date_format, args.category, args.delimiter)
     elif shell_mode:
         console.print("[red]Unknown command.[/]")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    code = forward_to_daemon(sys.argv[1:])
+    if code is None:
+        main()
+    else:
+        sys.exit(code)
\ No newline at end of file